@@ -1,13 +1,16 @@
 import traceback
 import asyncio
-from typing import Any, Literal, Sequence
+from typing import Any, Awaitable, Callable, Literal, Sequence
 from datetime import datetime
 import signal
+from collections import deque
 from contextlib import suppress
+from io import BytesIO
 
 from telegram import MessageId, Update, Message, BotCommand, User
-from telegram.ext import Application, CommandHandler, ExtBot, CallbackContext, JobQueue, MessageHandler, filters, MessageReactionHandler, AIORateLimiter
+from telegram.ext import Application, BaseHandler, CommandHandler, ExtBot, CallbackContext, JobQueue, MessageHandler, filters, MessageReactionHandler
 from telegram.constants import ChatType, ChatAction, BOT_API_VERSION, ParseMode
+from telegram.request import HTTPXRequest
 import telegram.error
 from telegram_markdown_converter import convert_markdown
 
@@ -17,34 +20,105 @@ from uf.src.sql import engine, init_db, healthy
 from uf.src.sql.repository import UFRepository
 from uf.src.cache import DataCache
 from uf.src.spam_detect import SpamDetector
+from uf.src.rate_limit import GroupAwareLimiter
 
 class TopicGroupFilter(filters.MessageFilter):
+    __slots__ = ("topic_chat_id", "admin_user_id", "_sg")
+
     def __init__(self, topic_chat_id: int, admin_user_id: int) -> None:
         super().__init__()
         self.topic_chat_id = topic_chat_id
         self.admin_user_id = admin_user_id
+        self._sg = ChatType.SUPERGROUP
 
     def filter(self, message: Message) -> bool:
-        if not message.chat or not message.from_user:
-            return False
+        # 该过滤器会对每一条消息执行，按选择性从高到低短路判断
+        c = message.chat
+        u = message.from_user
+        return bool(
+            c and u
+            and c.id == self.topic_chat_id # 必须是指定群
+            and u.id == self.admin_user_id # 必须是管理员发的
+            and c.type is self._sg # 必须是超级群（Chat.type 已被转换为枚举成员）
+            and c.is_forum # 必须是话题群
+        )
 
-        # 必须是超级群
-        if message.chat.type != ChatType.SUPERGROUP:
-            return False
+COPYRIGHT_TEXT = "Copyright (C) 2026 Azusa-Mikan"
+
+HELP_TEXT = (
+    "/start - 开始验证（验证通过则无返回）\n"
+    "/help - 显示此信息\n"
+    "/d - 撤回一个消息（必须回复一个消息）\n"
+    "/ban - 封禁用户（仅管理员）\n"
+    "/unban - 解封用户（仅管理员）\n"
+    "/info - 获取用户信息/消息细节/Bot信息（仅管理员）\n"
+    "/verify - 手动验证用户（仅管理员）\n"
+    "发送验证码 - 验证\n"
+    "发送消息 - 消息将转发到所有者\n\n"
+    f"{COPYRIGHT_TEXT}"
+)
+
+Route = Literal["topic", "private", "any"]
+
+class ChatRouter(BaseHandler[Update, "Context", None]):
+    """
+    按 chat 预先分组的 handler 集合
+
+    注册为单个 handler，每个 update 只读取一次 effective_chat，
+    之后只在对应分组内按注册顺序检查，其它 chat 的 handler 不会被执行过滤器
+    """
+    __slots__ = ("topic_chat_id", "_handlers_by_chat", "_private", "_other")
+
+    def __init__(self, topic_chat_id: int, handlers: Sequence[tuple[Route, BaseHandler[Update, "Context", Any]]]) -> None:
+        super().__init__(self._unused)
+        self.topic_chat_id = topic_chat_id
+        self._handlers_by_chat: dict[int, list[BaseHandler[Update, Context, Any]]] = {
+            topic_chat_id: [h for r, h in handlers if r in ("topic", "any")]
+        }
+        self._private: list[BaseHandler[Update, Context, Any]] = [h for r, h in handlers if r in ("private", "any")]
+        self._other: list[BaseHandler[Update, Context, Any]] = [h for r, h in handlers if r == "any"]
 
-        # 必须是指定群
-        if message.chat.id != self.topic_chat_id:
-            return False
+    @staticmethod
+    async def _unused(update: Update, context: "Context") -> None:
+        raise RuntimeError("ChatRouter 的回调不应被直接调用")
 
-        # 必须是管理员发的
-        if message.from_user.id != self.admin_user_id:
-            return False
-        
-        # 必须是话题群
-        if not message.chat.is_forum:
-            return False
+    def check_update(self, update: object) -> tuple[BaseHandler[Update, "Context", Any], object] | None:
+        if not isinstance(update, Update):
+            return None
+        chat = update.effective_chat
+        if chat is None:
+            candidates = self._other
+        else:
+            candidates = self._handlers_by_chat.get(chat.id) or (
+                self._private if chat.type is ChatType.PRIVATE else self._other
+            )
+        for handler in candidates:
+            check = handler.check_update(update)
+            if check is not None and check is not False:
+                return handler, check
+        return None
 
-        return True
+    async def handle_update(
+            self,
+            update: Update,
+            application: "App",
+            check_result: tuple[BaseHandler[Update, "Context", Any], object],
+            context: "Context",
+        ) -> Any:
+        handler, check = check_result
+        return await handler.handle_update(update, application, check, context)
+
+class BurstBuffer:
+    """同一用户短时间内连续发送、等待合并为一次 copy_messages 的消息"""
+    __slots__ = ("topic_id", "from_chat_id", "items", "handle", "update", "context")
+
+    def __init__(self, topic_id: int, from_chat_id: int, update: Update, context: "Context") -> None:
+        self.topic_id: int = topic_id
+        self.from_chat_id: int = from_chat_id
+        self.items: deque[tuple[int, str]] = deque() # (私聊消息ID, 理由)
+        self.handle: asyncio.TimerHandle | None = None
+        self.update: Update = update
+        self.context: Context = context
 
 # Application[
 #     ExtBot[None],
@@ -71,6 +145,7 @@ ChatData = dict[Any, Any]
 UserData = dict[Any, Any]
 Context = CallbackContext[ExtBot[None], UserData, ChatData, BotData]
 App = Application[ExtBot[None], Context, UserData, ChatData, BotData, JobQueue[Context]]
+HandlerCallback = Callable[[Update, Context], Awaitable[None]]
 
 class MyBot:
     def __init__(self, token: str, topic_chat_id: int, admin_user_id: int, ttl: int) -> None:
@@ -84,11 +159,20 @@ class MyBot:
         self.uf_repo: UFRepository = UFRepository()
         self.spamd: SpamDetector = SpamDetector()
         self.topic_filter = TopicGroupFilter(self.topic_chat_id, self.admin_user_id)
-
-        self.str_bool_map: dict[str, bool] = {
-            "true": True,
-            "false": False,
-        }
+        # TopicGroupFilter 已要求发送者为管理员，管理员命令直接复用它，不再叠加 filters.User
+        self._admin_topic_filter = self.topic_filter
+        self._topic_edit_filter = self.topic_filter & filters.UpdateType.EDITED_MESSAGE
+        self._topic_new_filter = self.topic_filter & ~filters.UpdateType.EDITED_MESSAGE
+        self._private_edit_filter = filters.ChatType.PRIVATE & filters.UpdateType.EDITED_MESSAGE
+        self._private_new_filter = filters.ChatType.PRIVATE & ~filters.COMMAND & ~filters.UpdateType.EDITED_MESSAGE
+        self._insert_msg_q: asyncio.Queue[tuple[int, int, int, bool, str]] = asyncio.Queue()
+        self._insert_msg_batch_size: int = 64
+        self._insert_msg_task: asyncio.Task[None] | None = None
+        self._captcha_pool: asyncio.Queue[tuple[str, BytesIO]] = asyncio.Queue(maxsize=8)
+        self._captcha_task: asyncio.Task[None] | None = None
+        self._bursts: dict[int, BurstBuffer] = {}
+        self._burst_delay: float = 0.2
+        self._burst_max: int = 100 # copy_messages 单次最多 100 条
 
     def _init_bot(self) -> App:
         if not self.token or not self.topic_chat_id or not self.admin_user_id or self.ttl <= 0:
@@ -97,9 +181,20 @@ class MyBot:
         app = Application.builder()
         app.token(self.token)
         app.post_init(self._on_startup)
+        app.post_stop(self._on_stop)
         app.post_shutdown(self._on_shutdown)
         app.concurrent_updates(8)
-        app.rate_limiter(AIORateLimiter(max_retries=3))
+        # 8 个并发 update 加上后台任务（输入状态、验证码、消息合并发送）会占满默认的连接池
+        app.request(HTTPXRequest(
+            connection_pool_size=32,
+            connect_timeout=5,
+            read_timeout=20,
+            write_timeout=20,
+            pool_timeout=3,
+        ))
+        # getUpdates 长轮询使用独立的连接，不与发送请求争抢
+        app.get_updates_request(HTTPXRequest(connection_pool_size=1, read_timeout=40))
+        app.rate_limiter(GroupAwareLimiter(max_retries=3))
         return app.build()
 
     async def _create_spam_topic(self, app: App) -> bool:
@@ -154,78 +249,62 @@ class MyBot:
             topics_check,
         ) = True, True, True, True, True
         tg_log.info("Bot 开始自检")
-        await app.bot.send_message(
-            chat_id=self.topic_chat_id,
-            text="Bot 开始自检"
+        # 自检结果汇总后一次性发送到群组
+        report: list[str] = ["Bot 开始自检"]
+        chat, member = await asyncio.gather(
+            app.bot.get_chat(self.topic_chat_id),
+            app.bot.get_chat_member(self.topic_chat_id, me.id),
         )
-        chat = await app.bot.get_chat(self.topic_chat_id)
-        member = await app.bot.get_chat_member(self.topic_chat_id, me.id)
         privacy_disabled = me.can_read_all_group_messages
         is_admin = member.status in ("administrator", "creator")
         can_manage_topics = bool(getattr(member, "can_manage_topics", False))
 
         done_msg = "Bot 自检完成，没有任何错误，可正常使用"
 
-        tg_log.debug(f"正在检查配置中指定的 topic_chat_id - {self.topic_chat_id} 是否符合要求")
+        tg_log.debug("正在检查配置中指定的 topic_chat_id - %s 是否符合要求", self.topic_chat_id)
         if chat.type != ChatType.SUPERGROUP:
-            await app.bot.send_message(
-                chat_id=self.topic_chat_id,
-                text="本群群组类型不符合要求，请升级成超级群后重启程序"
-            )
+            report.append("本群群组类型不符合要求，请升级成超级群后重启程序")
             tg_log.error(f"配置的 topic_chat_id 中群组类型不符合要求，请升级成超级群后重启程序")
             type_check = False
         
-        tg_log.debug(f"正在检查配置中指定的 topic_chat_id - {self.topic_chat_id} 是否开启话题模式")
+        tg_log.debug("正在检查配置中指定的 topic_chat_id - %s 是否开启话题模式", self.topic_chat_id)
         if not chat.is_forum:
-            await app.bot.send_message(
-                chat_id=self.topic_chat_id,
-                text="本群未开启话题模式，请开启后重启程序"
-            )
+            report.append("本群未开启话题模式，请开启后重启程序")
             tg_log.error(f"配置的 topic_chat_id 中未开启话题模式，请开启后重启程序")
             forum_check = False
         
-        tg_log.debug(f"正在检查配置中指定的 topic_chat_id - {self.topic_chat_id} 是否为管理员")
+        tg_log.debug("正在检查配置中指定的 topic_chat_id - %s 是否为管理员", self.topic_chat_id)
         if not is_admin:
-            await app.bot.send_message(
-                chat_id=self.topic_chat_id,
-                text="Bot 在本群不是管理员，请赋予管理员权限后重启程序"
-            )
+            report.append("Bot 在本群不是管理员，请赋予管理员权限后重启程序")
             tg_log.error(f"Bot 在配置的 topic_chat_id 中不是管理员，请赋予管理员权限后重启程序")
             admin_check = False
         
-        tg_log.debug(f"正在检查 Bot 是否开启隐私模式")
+        tg_log.debug("正在检查 Bot 是否开启隐私模式")
         if not privacy_disabled:
-            await app.bot.send_message(
-                chat_id=self.topic_chat_id,
-                text="Bot 目前处于隐私模式，请关闭后重启程序"
-            )
+            report.append("Bot 目前处于隐私模式，请关闭后重启程序")
             tg_log.error(f"Bot 目前处于隐私模式，请关闭后重启程序")
             privacy_check = False
         
-        tg_log.debug(f"正在检查配置中指定的 topic_chat_id - {self.topic_chat_id} 是否开启 管理话题/创建话题 权限")
+        tg_log.debug("正在检查配置中指定的 topic_chat_id - %s 是否开启 管理话题/创建话题 权限", self.topic_chat_id)
         if not can_manage_topics:
-            await app.bot.send_message(
-                chat_id=self.topic_chat_id,
-                text="Bot 在本群缺少 管理话题 权限，请赋予权限后重启程序"
-            )
+            report.append("Bot 在本群缺少 管理话题 权限，请赋予权限后重启程序")
             tg_log.error(f"Bot 在配置的 topic_chat_id 中缺少 管理话题 权限，请赋予权限后重启程序")
             topics_check = False
         else:
             topics_check: bool = await self._create_spam_topic(app)
 
         if all((type_check, forum_check, admin_check, privacy_check, topics_check)):
-            await app.bot.send_message(
-                chat_id=self.topic_chat_id,
-                text=done_msg
-            )
+            report.append(done_msg)
             tg_log.info(done_msg)
         else:
-            await app.bot.send_message(
-                chat_id=self.topic_chat_id,
-                text="Bot 自检失败，存在错误，请解决以上问题后重启程序"
-            )
+            report.append("Bot 自检失败，存在错误，请解决以上问题后重启程序")
             tg_log.error("Bot 自检失败，存在错误，请解决后重启程序")
 
+        await app.bot.send_message(
+            chat_id=self.topic_chat_id,
+            text="\n".join(report)
+        )
+
     async def create_topic(self, update: Update, context: Context) -> None:
         """创建新的 topic"""
         if not update.effective_user:
@@ -250,6 +329,7 @@ class MyBot:
         existing = await self.uf_repo.select_user(userid, 'userid')
         if existing:
             self.cache.set_flag(userid, "to_topic", existing.topic)
+            self.cache.set_topic(existing.topic, "to_user", userid)
             return
 
         try:
@@ -277,6 +357,7 @@ class MyBot:
             return
 
         self.cache.set_flag(userid, "to_topic", topic.message_thread_id)
+        self.cache.set_topic(topic.message_thread_id, "to_user", userid)
         return
 
     async def forward_on_spam_topic(
@@ -295,44 +376,35 @@ class MyBot:
         await msg.reply_text(reason)
         return msg
 
-    async def keep_action(
-            self,
-            lock: asyncio.Lock,
-            context: Context,
-            chat_id: int,
-            action: ChatAction,
-            topic_id: int
-        ):
-        while lock.locked():
-            await context.bot.send_chat_action(
-                chat_id=chat_id,
-                action=action,
+    def _fire_typing(self, context: Context, topic_id: int, handle: list[asyncio.TimerHandle]) -> None:
+        """发送一次 typing 并安排下一次刷新，handle[0] 始终是最新的定时器"""
+        handle[0] = asyncio.get_running_loop().call_later(4.5, self._fire_typing, context, topic_id, handle)
+        t = asyncio.create_task(
+            context.bot.send_chat_action(
+                chat_id=self.topic_chat_id,
+                action=ChatAction.TYPING,
                 message_thread_id=topic_id,
             )
-            await asyncio.sleep(4.5)
+        )
+        t.add_done_callback(self._log_action_error)
+
+    def _log_action_error(self, t: asyncio.Task[bool]) -> None:
+        if not t.cancelled() and t.exception():
+            tg_log.warning(f"发送 chat action 失败: {t.exception()}")
 
     async def _check_spam_with_typing(
             self,
-            lock: asyncio.Lock,
             context: Context,
             topic_id: int,
             text: str,
         ) -> tuple[bool, str]:
-        t = asyncio.create_task(
-            self.keep_action(
-                lock=lock,
-                context=context,
-                chat_id=self.topic_chat_id,
-                action=ChatAction.TYPING,
-                topic_id=topic_id,
-            )
-        )
+        # 检测在 4 秒内完成时不会发送任何 chat action
+        handle: list[asyncio.TimerHandle] = []
+        handle.append(asyncio.get_running_loop().call_later(4.0, self._fire_typing, context, topic_id, handle))
         try:
             return await self.spamd.check_spam(text)
         finally:
-            t.cancel()
-            with suppress(asyncio.CancelledError):
-                await t
+            handle[0].cancel()
 
     async def msg_to_topic(self, update: Update, context: Context) -> None:
         """将用户的消息发送到对应的话题"""
@@ -340,70 +412,138 @@ class MyBot:
             return
 
         userid = update.effective_user.id
-        lock = self.cache.get_user_lock(userid)
 
-        async with lock:
-            blocked = await self.uf_repo.select_block(userid)
-            if blocked:
-                await update.message.reply_text("你已被封禁")
-                self.cache.set_flag(userid, VerifyType.BLOCK.value, blocked)
+        state = await self.uf_repo.select_user_state(userid)
+        if state.blocked:
+            await update.message.reply_text("你已被封禁")
+            self.cache.set_flag(userid, VerifyType.BLOCK.value, True)
+            return
+
+        to_topic = self.cache.get_flag(userid, "to_topic", None)
+        try:
+            msg_count = self.cache.flood_message(userid, window=4)
+            if msg_count > 10:
+                await update.message.reply_text("你已被封禁，原因: 刷屏")
+                self.cache.set_flag(userid, "block", True)
+                await self.uf_repo.insert_block(userid)
                 return
+            if msg_count > 7:
+                await update.message.reply_text("请不要刷屏，否则将会被封禁")
 
-            to_topic = self.cache.get_flag(userid, "to_topic", None)
-            try:
-                msg_count = self.cache.flood_message(userid, window=4)
-                if msg_count > 10:
-                    await update.message.reply_text("你已被封禁，原因: 刷屏")
-                    self.cache.set_flag(userid, "block", True)
-                    await self.uf_repo.insert_block(userid)
-                    return
-                if msg_count > 7:
-                    await update.message.reply_text("请不要刷屏，否则将会被封禁")
-
-                topic_id = to_topic
-                if not topic_id:
-                    topic = await self.uf_repo.select_user(userid, "userid")
-                    if not topic:
-                        await self.create_topic(update, context)
-                        topic = await self.uf_repo.select_user(userid, "userid")
-                        if not topic:
-                            await update.message.reply_text("Bot错误，已不可用，请使用其它方式联系")
-                            raise Exception("创建话题失败")
-
-                    topic_id = topic.topic
-                    self.cache.set_flag(userid, "to_topic", topic_id)
-
-                msg_text = update.message.text
-                if msg_text:
-                    is_spam, reason = await self._check_spam_with_typing(
-                        lock=lock,
-                        context=context,
-                        topic_id=topic_id,
-                        text=msg_text,
-                    )
-                else:
-                    is_spam, reason = False, "无文本消息"
-
-                if is_spam:
-                    to_topic_msg = await self.forward_on_spam_topic(
-                        context=context,
-                        from_chat_id=update.effective_chat.id,
-                        message_id=update.message.message_id,
-                        reason=reason
-                    )
-                    await self.uf_repo.insert_message(userid, update.message.message_id, to_topic_msg.message_id, is_spam, reason)
-                    return
-
-                to_topic_msg = await context.bot.copy_message(
-                    chat_id=self.topic_chat_id,
-                    message_thread_id=topic_id,
+            topic_id = to_topic or state.topic
+            if not topic_id:
+                await self.create_topic(update, context)
+                topic = await self.uf_repo.select_user(userid, "userid")
+                if not topic:
+                    await update.message.reply_text("Bot错误，已不可用，请使用其它方式联系")
+                    raise Exception("创建话题失败")
+
+                topic_id = topic.topic
+            if topic_id != to_topic:
+                self.cache.set_flag(userid, "to_topic", topic_id)
+
+            msg_text = update.message.text
+            if msg_text:
+                is_spam, reason = await self._check_spam_with_typing(
+                    context=context,
+                    topic_id=topic_id,
+                    text=msg_text,
+                )
+            else:
+                is_spam, reason = False, "无文本消息"
+
+            if is_spam:
+                to_topic_msg = await self.forward_on_spam_topic(
+                    context=context,
                     from_chat_id=update.effective_chat.id,
                     message_id=update.message.message_id,
+                    reason=reason
                 )
-                await self.uf_repo.insert_message(userid, update.message.message_id, to_topic_msg.message_id, is_spam, reason)
+                self._insert_msg_q.put_nowait((userid, update.message.message_id, to_topic_msg.message_id, is_spam, reason))
                 return
-            except telegram.error.TimedOut:
-                await update.message.reply_text("Bot 超时，你的消息未传达\n你可以尝试重新发送或使用其它联系方式")
+
+            self._buffer_copy(userid, topic_id, update, context, reason)
+            return
+        except telegram.error.TimedOut:
+            await update.message.reply_text("Bot 超时，你的消息未传达\n你可以尝试重新发送或使用其它联系方式")
+
+    def _buffer_copy(self, userid: int, topic_id: int, update: Update, context: Context, reason: str) -> None:
+        """
+        把消息放入该用户的合并缓冲区
+
+        _burst_delay 秒内的后续消息（例如相册）会合并为一次 copy_messages，
+        只占用一次群组限流额度；缓冲区满时立即发送
+        """
+        if not update.message or not update.effective_chat:
+            return
+
+        buf = self._bursts.get(userid)
+        if buf is None or buf.topic_id != topic_id:
+            if buf is not None:
+                self._schedule_burst_flush(userid)
+            buf = BurstBuffer(topic_id, update.effective_chat.id, update, context)
+            self._bursts[userid] = buf
+            buf.handle = asyncio.get_running_loop().call_later(self._burst_delay, self._schedule_burst_flush, userid)
+        buf.items.append((update.message.message_id, reason))
+        buf.update = update
+        buf.context = context
+        if len(buf.items) >= self._burst_max:
+            self._schedule_burst_flush(userid)
+
+    def _schedule_burst_flush(self, userid: int) -> None:
+        """取出缓冲区，并把发送任务排入该用户的队列，保证与该用户后续的消息保持顺序"""
+        buf = self._bursts.pop(userid, None)
+        if buf is None:
+            return
+        if buf.handle:
+            buf.handle.cancel()
+        self._submit(userid, buf.update, buf.context, lambda: self._flush_burst(userid, buf))
+
+    async def _flush_burst(self, userid: int, buf: BurstBuffer) -> None:
+        ids = [msg_id for msg_id, _ in buf.items]
+        try:
+            copied = await buf.context.bot.copy_messages(
+                chat_id=self.topic_chat_id,
+                message_thread_id=buf.topic_id,
+                from_chat_id=buf.from_chat_id,
+                message_ids=ids,
+            )
+        except telegram.error.TimedOut:
+            if len(ids) == 1:
+                text = "Bot 超时，你的消息未传达\n你可以尝试重新发送或使用其它联系方式"
+            else:
+                text = f"Bot 超时，从这条消息开始的 {len(ids)} 条消息均未传达\n你可以尝试重新发送或使用其它联系方式"
+            await buf.context.bot.send_message(
+                chat_id=buf.from_chat_id,
+                text=text,
+                reply_to_message_id=ids[0],
+            )
+            return
+
+        if len(copied) == len(ids):
+            for (msg_id, reason), topic_msg in zip(buf.items, copied):
+                self._insert_msg_q.put_nowait((userid, msg_id, topic_msg.message_id, False, reason))
+            return
+
+        # 无法复制的消息会被跳过，此时无法按位置对应：撤回这一批已复制的消息，再逐条复制并记录映射
+        tg_log.warning(f"{userid} 的 {len(ids)} 条消息只复制成功 {len(copied)} 条，改为逐条复制")
+        if copied:
+            try:
+                await buf.context.bot.delete_messages(self.topic_chat_id, [m.message_id for m in copied])
+            except telegram.error.TelegramError as e:
+                tg_log.warning(f"撤回 {userid} 已复制的 {len(copied)} 条消息失败，话题中可能出现重复消息：{e}")
+        for msg_id, reason in buf.items:
+            try:
+                topic_msg = await buf.context.bot.copy_message(
+                    chat_id=self.topic_chat_id,
+                    message_thread_id=buf.topic_id,
+                    from_chat_id=buf.from_chat_id,
+                    message_id=msg_id,
+                )
+            except telegram.error.BadRequest as e:
+                tg_log.warning(f"{userid} 的消息 {msg_id} 无法复制：{e}")
+                continue
+            self._insert_msg_q.put_nowait((userid, msg_id, topic_msg.message_id, False, reason))
 
     async def _send_captcha_gif(
             self,
@@ -415,17 +555,34 @@ class MyBot:
         if not update.message:
             return
 
-        msg = await update.message.reply_text("请稍候")
+        # 只有预生成的验证码用完时才需要让用户等待
+        msg = await update.message.reply_text("请稍候") if self._captcha_pool.empty() else None
         self.cache.set_flag(user_id, VerifyType.VERIFY.value, False)
         self.cache.set_flag(user_id, VerifyType.VERIFY_ATTEMPTS.value, 0)
-        captcha_text, gif = await self.visual.async_generate_captcha_gif()
+        # 池为空时直接生成，不等待后台任务补充（后台任务持续失败时会一直等不到）
+        if self._captcha_pool.empty():
+            captcha_text, gif = await self.visual.async_generate_captcha_gif()
+        else:
+            captcha_text, gif = self._captcha_pool.get_nowait()
         if mode == "insert":
             await self.uf_repo.insert_verify(user_id, captcha_text, self.ttl)
         else:
             await self.uf_repo.update_verify_code(user_id, captcha_text, self.ttl)
-        await msg.delete()
+        if msg:
+            await msg.delete()
         await update.message.reply_animation(gif, caption=caption)
 
+    async def _captcha_producer(self) -> None:
+        """后台预生成验证码 GIF，池满时阻塞等待"""
+        while True:
+            try:
+                item = await self.visual.async_generate_captcha_gif()
+            except Exception:
+                tg_log.exception("预生成验证码失败")
+                await asyncio.sleep(1)
+                continue
+            await self._captcha_pool.put(item)
+
     async def _gif_verify(self, update: Update, first: bool = False) -> bool:
         """GIF验证"""
         if not update.message or not update.effective_user:
@@ -438,26 +595,25 @@ class MyBot:
 
         user_id = update.effective_user.id
 
-        async with self.cache.get_user_lock(user_id):
-            verify = await self.uf_repo.select_valid_verify(user_id)
-            if not verify:
-                await self._send_captcha_gif(
-                    update=update,
-                    user_id=user_id,
-                    caption=verify_msg,
-                    mode="insert",
-                )
-                return False
-            if verify.verified:
-                return True
-            if verify.expires_at < datetime.now():
-                await self._send_captcha_gif(
-                    update=update,
-                    user_id=user_id,
-                    caption="验证码已过期，请重新输入（不区分大小写）",
-                    mode="update",
-                )
-                return False
+        verify = await self.uf_repo.select_valid_verify(user_id)
+        if not verify:
+            await self._send_captcha_gif(
+                update=update,
+                user_id=user_id,
+                caption=verify_msg,
+                mode="insert",
+            )
+            return False
+        if verify.verified:
+            return True
+        if verify.expires_at < datetime.now():
+            await self._send_captcha_gif(
+                update=update,
+                user_id=user_id,
+                caption="验证码已过期，请重新输入（不区分大小写）",
+                mode="update",
+            )
+            return False
         
         return True
 
@@ -475,28 +631,27 @@ class MyBot:
         if verify.verified:
             return
 
-        async with self.cache.get_user_lock(user_id):
-            attempts: int = self.cache.get_flag(user_id, VerifyType.VERIFY_ATTEMPTS.value, 0)
-            if text.upper() == verify.code:
-                await self.uf_repo.update_verified(user_id, True)
-                self.cache.set_flag(user_id, VerifyType.VERIFY.value, True)
-                self.cache.set_flag(user_id, VerifyType.VERIFY_ATTEMPTS.value, 0)
-                await update.message.reply_text("验证已通过，你可以发送消息了")
-                await self.create_topic(update, context)
+        attempts: int = self.cache.get_flag(user_id, VerifyType.VERIFY_ATTEMPTS.value, 0)
+        if text.upper() == verify.code:
+            await self.uf_repo.update_verified(user_id, True)
+            self.cache.set_flag(user_id, VerifyType.VERIFY.value, True)
+            self.cache.set_flag(user_id, VerifyType.VERIFY_ATTEMPTS.value, 0)
+            await update.message.reply_text("验证已通过，你可以发送消息了")
+            await self.create_topic(update, context)
+            return
+        else:
+            attempts += 1
+            self.cache.set_flag(user_id, VerifyType.VERIFY_ATTEMPTS.value, attempts)
+            remaining: int = 3 - attempts
+            if remaining > 0:
+                await update.message.reply_text(f"验证码错误，你还有 {remaining} 次机会。")
                 return
             else:
-                attempts += 1
-                self.cache.set_flag(user_id, VerifyType.VERIFY_ATTEMPTS.value, attempts)
-                remaining: int = 3 - attempts
-                if remaining > 0:
-                    await update.message.reply_text(f"验证码错误，你还有 {remaining} 次机会。")
-                    return
-                else:
-                    await update.message.reply_text("验证码错误次数过多，你已被封禁。")
-                    self.cache.set_flag(user_id, VerifyType.VERIFY.value, False)
-                    await self.uf_repo.insert_block(user_id)
-                    self.cache.set_flag(user_id, "block", True)
-                    return
+                await update.message.reply_text("验证码错误次数过多，你已被封禁。")
+                self.cache.set_flag(user_id, VerifyType.VERIFY.value, False)
+                await self.uf_repo.insert_block(user_id)
+                self.cache.set_flag(user_id, "block", True)
+                return
 
     async def _resolve_userid_by_topic(self, topic_id: int) -> int | None:
         to_user = self.cache.get_topic(topic_id, "to_user")
@@ -510,15 +665,15 @@ class MyBot:
         self.cache.set_topic(topic_id, "to_user", user_data.userid)
         return user_data.userid
 
-    async def _forward_topic_message_to_user(
+    def _forward_topic_message_to_user(
             self,
+            update: Update,
             context: Context,
             topic_id: int,
             to_user: int,
             topic_message_id: int,
         ) -> None:
-        lock = self.cache.get_user_lock(to_user)
-        async with lock:
+        async def forward() -> None:
             to_private_msg = await self.topic_msg_to_private(
                 context=context,
                 chat_id=to_user,
@@ -529,13 +684,15 @@ class MyBot:
             if not to_private_msg:
                 return
             private_message_id = to_private_msg.message_id
-            await self.uf_repo.insert_message(
+            self._insert_msg_q.put_nowait((
                 to_user,
                 private_message_id,
                 topic_message_id,
                 False,
                 "管理员消息",
-            )
+            ))
+
+        self._submit(to_user, update, context, forward)
 
     async def topic_msg_to_private(
             self,
@@ -572,7 +729,8 @@ class MyBot:
             await update.message.reply_text("对应的用户不存在")
             return
 
-        await self._forward_topic_message_to_user(
+        self._forward_topic_message_to_user(
+            update=update,
             context=context,
             topic_id=topic_id,
             to_user=to_user,
@@ -608,8 +766,9 @@ class MyBot:
         await self._verify_attempts(update, context, text)
         return
 
-    async def _ensure_single_reaction(
+    def _ensure_single_reaction(
             self,
+            update: Update,
             context: Context,
             warn_chat_id: int,
             warn_text: str,
@@ -618,9 +777,12 @@ class MyBot:
         if len(reaction) <= 1:
             return list(reaction)
 
-        await context.bot.send_message(
-            chat_id=warn_chat_id,
-            text=warn_text,
+        context.application.create_task(
+            context.bot.send_message(
+                chat_id=warn_chat_id,
+                text=warn_text,
+            ),
+            update=update,
         )
         return [reaction[0]]
 
@@ -640,16 +802,21 @@ class MyBot:
             if not msg_data:
                 return
             reaction = update.message_reaction.new_reaction
-            reaction = await self._ensure_single_reaction(
+            reaction = self._ensure_single_reaction(
+                update=update,
                 context=context,
                 warn_chat_id=chat_id,
                 warn_text="虽然你可以多次 reaction，但管理员只能收到第一个 reaction",
                 reaction=reaction,
             )
-            await context.bot.set_message_reaction(
-                chat_id=self.topic_chat_id,
-                message_id=msg_data.topic_message_id,
-                reaction=reaction,
+            # 不等待表态同步完成，失败时由 PTB 交给错误处理器
+            context.application.create_task(
+                context.bot.set_message_reaction(
+                    chat_id=self.topic_chat_id,
+                    message_id=msg_data.topic_message_id,
+                    reaction=reaction,
+                ),
+                update=update,
             )
             return
 
@@ -660,16 +827,20 @@ class MyBot:
         if not msg_data:
             return
         reaction = update.message_reaction.new_reaction
-        reaction = await self._ensure_single_reaction(
+        reaction = self._ensure_single_reaction(
+            update=update,
             context=context,
             warn_chat_id=self.topic_chat_id,
             warn_text="虽然你可以多次 reaction，但用户只能收到第一个 reaction",
             reaction=reaction,
         )
-        await context.bot.set_message_reaction(
-            chat_id=msg_data.userid,
-            message_id=msg_data.private_message_id,
-            reaction=reaction,
+        context.application.create_task(
+            context.bot.set_message_reaction(
+                chat_id=msg_data.userid,
+                message_id=msg_data.private_message_id,
+                reaction=reaction,
+            ),
+            update=update,
         )
 
     async def handle_topic_edited_message(self, update: Update, context: Context) -> None:
@@ -696,39 +867,37 @@ class MyBot:
         msg_id = update.edited_message.message_id
         userid = update.effective_user.id
         msg_new_text = update.edited_message.text
-        msg_data = await self.uf_repo.select_message(msg_id, topic_mode=False, userid=userid)
-        user_data = await self.uf_repo.select_user(userid, 'userid')
+        async with self.uf_repo.request_scope():
+            msg_data = await self.uf_repo.select_message(msg_id, topic_mode=False, userid=userid)
+            user_data = await self.uf_repo.select_user(userid, 'userid')
         if not msg_data or not user_data:
             return
 
-        lock = self.cache.get_user_lock(userid)
-        async with lock:
-            is_spam, reason = await self._check_spam_with_typing(
-                lock=lock,
+        is_spam, reason = await self._check_spam_with_typing(
+            context=context,
+            topic_id=user_data.topic,
+            text=msg_new_text,
+        )
+
+        if is_spam:
+            await self.forward_on_spam_topic(
                 context=context,
-                topic_id=user_data.topic,
-                text=msg_new_text,
+                from_chat_id=userid,
+                message_id=msg_id,
+                reason=reason,
             )
-
-            if is_spam:
-                await self.forward_on_spam_topic(
-                    context=context,
-                    from_chat_id=userid,
-                    message_id=msg_id,
-                    reason=reason,
-                )
-                await context.bot.send_message(
-                    chat_id=userid,
-                    text=f"消息已被驳回，原因: {reason}",
-                    reply_to_message_id=msg_id,
-                )
-                return
-
-            await context.bot.edit_message_text(
-                chat_id=self.topic_chat_id,
-                message_id=msg_data.topic_message_id,
-                text=msg_new_text
+            await context.bot.send_message(
+                chat_id=userid,
+                text=f"消息已被驳回，原因: {reason}",
+                reply_to_message_id=msg_id,
             )
+            return
+
+        await context.bot.edit_message_text(
+            chat_id=self.topic_chat_id,
+            message_id=msg_data.topic_message_id,
+            text=msg_new_text
+        )
 
     async def _start(self, update: Update, context: Context) -> None:
         """处理 /start 命令"""
@@ -763,7 +932,7 @@ class MyBot:
         
         await context.bot.delete_message(msg.userid, msg.private_message_id)
         await context.bot.delete_message(self.topic_chat_id, msg.topic_message_id)
-        await self.uf_repo.delete_message(msg)
+        await self.uf_repo.delete_message(msg.id)
         return
 
     async def _ban(self, update: Update, context: Context) -> None:
@@ -785,9 +954,11 @@ class MyBot:
         pinned_msg = await update.message.reply_text("此用户已被封禁")
         await pinned_msg.pin(disable_notification=True)
 
-        async with self.cache.get_user_lock(user_data.userid):
+        async def block() -> None:
             await self.uf_repo.insert_block(user_data.userid, pinned_msg.message_id)
             self.cache.set_flag(user_data.userid, "block", True)
+
+        self._submit(user_data.userid, update, context, block)
         return
     
     async def _unban(self, update: Update, context: Context) -> None:
@@ -800,12 +971,13 @@ class MyBot:
             return
         
         topic_id = update.message.message_thread_id
-        user_data = await self.uf_repo.select_user(topic_id, "topic")
+        async with self.uf_repo.request_scope():
+            user_data = await self.uf_repo.select_user(topic_id, "topic")
+            block_data = await self.uf_repo.select_block_raw(user_data.userid) if user_data else None
         if not user_data:
             await update.message.reply_text("此用户无效")
             return
         
-        block_data = await self.uf_repo.select_block_raw(user_data.userid)
         if not block_data:
             await update.message.reply_text("此用户未被拉黑")
             return
@@ -813,79 +985,65 @@ class MyBot:
         if block_data.pinned_msg_id:
             await context.bot.delete_message(self.topic_chat_id, block_data.pinned_msg_id)
 
-        async with self.cache.get_user_lock(user_data.userid):
-            await self.uf_repo.delete_block(block_data)
+        message = update.message
+
+        async def unblock() -> None:
+            await self.uf_repo.delete_block(user_data.userid)
             self.cache.set_flag(user_data.userid, "block", False)
-        await update.message.reply_text("用户已解封")
+            await message.reply_text("用户已解封")
+
+        self._submit(user_data.userid, update, context, unblock)
         return
 
     async def _info_self(self, update: Update, context: Context) -> None:
         """获取机器人本身的信息"""
         if not update.message:
             return
-        bot = context.bot
-        me = await bot.get_me()
+        me = await context.bot.get_me()
 
         database_status, database_error = await healthy()
         if database_status:
             db_text = "正常"
-            (
-                verified_cnt,
-                blocked_cnt,
-                topics_cnt,
-                total_cnt,
-                spam_cnt
-            ) = await asyncio.gather(
-                self.uf_repo.count_verified_users(),
-                self.uf_repo.count_blocked_users(),
-                self.uf_repo.count_topics(),
-                self.uf_repo.count_messages_total(),
-                self.uf_repo.count_spam_messages(),
-            )
-            database_msg = (
-                f"\n> 通过用户数: {verified_cnt}\n"
-                f"> 封禁用户数: {blocked_cnt}\n"
-                f"> 创建话题数: {topics_cnt}\n"
-                f"> 保存消息数: {total_cnt}\n"
-                f"> 垃圾消息数: {spam_cnt}\n"
-            )
+            stats = await self.uf_repo.count_all_stats()
+            database_lines = [
+                f"> 通过用户数: {stats.verified}",
+                f"> 封禁用户数: {stats.blocked}",
+                f"> 创建话题数: {stats.topics}",
+                f"> 保存消息数: {stats.messages}",
+                f"> 垃圾消息数: {stats.spam}",
+            ]
         else:
             db_text = f"异常: {database_error}"
-            database_msg = "\n"
+            database_lines = []
 
 
         uptime = datetime.now() - self.cache.startup_time
-        uptime_str = (
-            f"{uptime.days}天 "
-            f"{uptime.seconds // 3600}小时 "
-            f"{(uptime.seconds % 3600) // 60}分钟 "
-            f"{uptime.seconds % 60}秒"
-        )
+        uptime_str = f"{uptime.days}天 {uptime.seconds // 3600}小时 {(uptime.seconds % 3600) // 60}分钟 {uptime.seconds % 60}秒"
 
         (
-            user_locks_size,
+            user_queues_size,
             user_data_size,
             topic_data_size,
             user_message_time_queues_size,
         ) = self.cache.get_cache_size()
 
-        final_msg = (
-            f"Bot 信息: \n"
-            f"> Bot 名称: {me.full_name}\n"
-            f"> Bot ID: {me.id}\n"
-            f"> Bot 用户名: @{me.username}\n"
-            f"> Bot 运行时间: {uptime_str}\n"
-            f"数据库信息: \n"
-            f"> 数据库后端: {engine.dialect.name}\n"
-            f"> 数据库状态: {db_text}"
-            f"{database_msg}"
-            f"缓存状态: \n"
-            f"> 用户锁占用: {user_locks_size}\n"
-            f"> 用户数据占用: {user_data_size}\n"
-            f"> 话题数据占用: {topic_data_size}\n"
-            f"> 用户消息时间队列占用: {user_message_time_queues_size}\n"
-            "Copyright (C) 2026 Azusa-Mikan"
-        )
+        final_msg = "\n".join([
+            "Bot 信息: ",
+            f"> Bot 名称: {me.full_name}",
+            f"> Bot ID: {me.id}",
+            f"> Bot 用户名: @{me.username}",
+            f"> Bot 运行时间: {uptime_str}",
+            "数据库信息: ",
+            f"> 数据库后端: {engine.dialect.name}",
+            f"> 数据库状态: {db_text}",
+            *database_lines,
+            "缓存状态: ",
+            f"> 用户任务队列: {user_queues_size}",
+            f"> 用户数据占用: {user_data_size}",
+            f"> 话题数据占用: {topic_data_size}",
+            f"> 用户消息时间队列占用: {user_message_time_queues_size}",
+            COPYRIGHT_TEXT,
+        ])
         await update.message.reply_text(convert_markdown(final_msg), parse_mode=ParseMode.MARKDOWN_V2)
 
     async def _info_user(self, update: Update) -> None:
@@ -894,24 +1052,25 @@ class MyBot:
             return
 
         topicid = update.message.message_thread_id
-        user_data = await self.uf_repo.select_user(topicid, "topic")
+        async with self.uf_repo.request_scope():
+            user_data = await self.uf_repo.select_user(topicid, "topic")
+            block = await self.uf_repo.select_block(user_data.userid) if user_data else False
         if not user_data:
             await update.message.reply_text("此用户无效")
             return
-        block = await self.uf_repo.select_block(user_data.userid)
         is_blocked = "是" if block else "否"
 
         user_name = f"@{user_data.username}" if user_data.username else "无"
 
-        final_msg = (
-            f"用户信息: \n"
-            f"> 用户ID: {user_data.userid}\n"
-            f"> 用户名: {user_name}\n"
-            f"> 语言代码: {user_data.language_code}\n"
-            f"> 是否为 Premium 用户: {'是' if user_data.is_premium else '否'}\n"
-            f"> 通过验证时间: {user_data.first_active_time}\n"
-            f"> 是否被封禁: {is_blocked}"
-        )
+        final_msg = "\n".join([
+            "用户信息: ",
+            f"> 用户ID: {user_data.userid}",
+            f"> 用户名: {user_name}",
+            f"> 语言代码: {user_data.language_code}",
+            f"> 是否为 Premium 用户: {'是' if user_data.is_premium else '否'}",
+            f"> 通过验证时间: {user_data.first_active_time}",
+            f"> 是否被封禁: {is_blocked}",
+        ])
         await update.message.reply_text(convert_markdown(final_msg), parse_mode=ParseMode.MARKDOWN_V2)
 
     async def _info_message(self, update: Update) -> None:
@@ -927,14 +1086,15 @@ class MyBot:
             await update.message.reply_text("此消息无效或在数据库中不存在")
             return
         
-        final_msg = (
-            f"消息信息: \n"
-            f"> 消息ID: {msg_data.topic_message_id}\n"
-            f"> 对应的私聊ID: {msg_data.private_message_id}\n"
-            f"> 消息发送时间: {msg_data.time}\n"
-            f"> 是否为垃圾消息: {'是' if msg_data.spam else '否'}\n"
-            f"> {'是' if msg_data.spam else '不是'}垃圾消息的理由: {msg_data.reason}"
-        )
+        is_spam = msg_data.spam
+        final_msg = "\n".join([
+            "消息信息: ",
+            f"> 消息ID: {msg_data.topic_message_id}",
+            f"> 对应的私聊ID: {msg_data.private_message_id}",
+            f"> 消息发送时间: {msg_data.time}",
+            f"> 是否为垃圾消息: {'是' if is_spam else '否'}",
+            f"> {'是' if is_spam else '不是'}垃圾消息的理由: {msg_data.reason}",
+        ])
         await update.message.reply_text(convert_markdown(final_msg), parse_mode=ParseMode.MARKDOWN_V2)
 
     async def _info_route(self, update: Update, context: Context) -> None:
@@ -977,12 +1137,12 @@ class MyBot:
             return
 
         bool_arg = args[0].strip().lower()
-        if bool_arg not in self.str_bool_map:
+        if bool_arg not in ("true", "false"):
             await update.message.reply_text(
                 "用法: /verify <true/false>"
             )
             return
-        verified = self.str_bool_map[bool_arg]
+        verified = bool_arg == "true"
         if not verified:
             self.cache.set_flag(user_data.userid, VerifyType.VERIFY.value, False)
             await self.uf_repo.update_verified(user_data.userid, False)
@@ -1007,24 +1167,129 @@ class MyBot:
             text=f"发生错误: {context.error}\n请检查日志",
         )
     
+    async def _flush_insert_queue(self, rows: list[tuple[int, int, int, bool, str]]) -> None:
+        """把队列中积压的消息并入 rows（最多一批）后一次性写入数据库"""
+        while len(rows) < self._insert_msg_batch_size:
+            try:
+                rows.append(self._insert_msg_q.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        try:
+            await self._insert_message_rows(rows)
+        finally:
+            for _ in rows:
+                self._insert_msg_q.task_done()
+
+    async def _insert_message_rows(self, rows: list[tuple[int, int, int, bool, str]]) -> None:
+        """
+        批量写入消息记录，失败时重试一次，仍失败则逐条写入
+
+        逐条写入仍然失败的记录交给 Application 的错误处理，与其它错误一样通知管理员
+        """
+        for attempt in range(2):
+            try:
+                await self.uf_repo.insert_message_many(rows)
+            except Exception:
+                tg_log.exception(f"批量写入 {len(rows)} 条消息记录失败（第 {attempt + 1} 次）")
+            else:
+                tg_log.debug("批量写入了 %s 条消息记录", len(rows))
+                return
+
+        failed: list[tuple[int, int, int, bool, str]] = []
+        error: Exception | None = None
+        for row in rows:
+            try:
+                await self.uf_repo.insert_message(*row)
+            except Exception as e:
+                failed.append(row)
+                error = error or e
+        if error is not None:
+            tg_log.error(f"{len(failed)} 条消息记录写入失败: {failed}")
+            # 同一批的失败通常原因相同，只通知一次；原始异常保留在 __cause__ 中供日志输出
+            report = RuntimeError(f"{len(failed)}/{len(rows)} 条消息记录写入失败: {error}")
+            report.__cause__ = error
+            await self.bot.process_error(None, report)
+
+    async def _insert_message_worker(self) -> None:
+        """
+        后台消息写入任务
+
+        阻塞等待第一条记录，再把写入期间积压的记录合并为一次 executemany；
+        不额外等待凑批，队列空闲时每条消息仍然立即写入
+        """
+        while True:
+            row = await self._insert_msg_q.get()
+            await self._flush_insert_queue([row])
+
     async def _on_shutdown(self, app: App) -> None:
+        await self.spamd.close()
+        if self._captcha_task:
+            self._captcha_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._captcha_task
+        await asyncio.to_thread(self.visual.close)
+        if self._insert_msg_task:
+            await self._insert_msg_q.join() # 等待积压的消息记录写完
+            self._insert_msg_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._insert_msg_task
         await engine.dispose()
         tg_log.info("Bot 已关闭")
 
+    def _submit(
+            self,
+            user_id: int,
+            update: Update,
+            context: Context,
+            job: Callable[[], Awaitable[None]],
+        ) -> None:
+        """把任务提交到该用户的队列，任务中的异常交给 Application 的错误处理"""
+        async def run() -> None:
+            try:
+                await job()
+            except Exception as e:
+                await context.application.process_error(update, e)
+
+        self.cache.submit(user_id, run)
+
+    def _per_chat(self, handler: HandlerCallback) -> HandlerCallback:
+        """
+        把 handler 包装为按 chat 分发的回调
+
+        更新被放入该 chat（私聊中即该用户）的队列后立即返回，不占用 concurrent_updates 的并发名额；
+        同一个 chat 的更新按顺序处理，不同 chat 之间互不阻塞
+        """
+        async def dispatch(update: Update, context: Context) -> None:
+            if not update.effective_chat:
+                await handler(update, context)
+                return
+            self._submit(update.effective_chat.id, update, context, lambda: handler(update, context))
+
+        return dispatch
+
+    async def _on_stop(self, app: App) -> None:
+        # 发出尚在合并等待中的消息并处理完已经入队的任务，此时 Bot 仍可发送消息
+        for userid in list(self._bursts):
+            self._schedule_burst_flush(userid)
+        await self.cache.drain()
+
     def register_handlers(self) -> None:
         self.bot.add_error_handler(self._on_error)
-        self.bot.add_handler(CommandHandler("start", self._start, filters=filters.ChatType.PRIVATE))
-        self.bot.add_handler(CommandHandler("help", self._help))
-        self.bot.add_handler(CommandHandler("d", self._delete))
-        self.bot.add_handler(CommandHandler("ban", self._ban, filters=self.topic_filter & filters.User(self.admin_user_id)))
-        self.bot.add_handler(CommandHandler("unban", self._unban, filters=self.topic_filter & filters.User(self.admin_user_id)))
-        self.bot.add_handler(CommandHandler("info", self._info_route, filters=self.topic_filter & filters.User(self.admin_user_id)))
-        self.bot.add_handler(CommandHandler("verify", self._verify, filters=self.topic_filter & filters.User(self.admin_user_id)))
-        self.bot.add_handler(MessageHandler(self.topic_filter & filters.UpdateType.EDITED_MESSAGE, self.handle_topic_edited_message))
-        self.bot.add_handler(MessageHandler(filters.ChatType.PRIVATE & filters.UpdateType.EDITED_MESSAGE, self.handle_private_edited_message))
-        self.bot.add_handler(MessageHandler(self.topic_filter & ~filters.UpdateType.EDITED_MESSAGE, self.handle_topic_message))
-        self.bot.add_handler(MessageHandler(filters.ChatType.PRIVATE & ~filters.COMMAND & ~filters.UpdateType.EDITED_MESSAGE, self.handle_private_message))
-        self.bot.add_handler(MessageReactionHandler(self.handle_reaction_message))
+        # 各 handler 自身的过滤器保持不变，ChatRouter 只负责跳过不可能匹配的 chat
+        self.bot.add_handler(ChatRouter(self.topic_chat_id, [
+            ("private", CommandHandler("start", self._per_chat(self._start), filters=filters.ChatType.PRIVATE)),
+            ("any", CommandHandler("help", self._help)),
+            ("any", CommandHandler("d", self._delete)),
+            ("topic", CommandHandler("ban", self._ban, filters=self._admin_topic_filter)),
+            ("topic", CommandHandler("unban", self._unban, filters=self._admin_topic_filter)),
+            ("topic", CommandHandler("info", self._info_route, filters=self._admin_topic_filter)),
+            ("topic", CommandHandler("verify", self._verify, filters=self._admin_topic_filter)),
+            ("topic", MessageHandler(self._topic_edit_filter, self.handle_topic_edited_message)),
+            ("private", MessageHandler(self._private_edit_filter, self._per_chat(self.handle_private_edited_message))),
+            ("topic", MessageHandler(self._topic_new_filter, self.handle_topic_message)),
+            ("private", MessageHandler(self._private_new_filter, self._per_chat(self.handle_private_message))),
+            ("any", MessageReactionHandler(self.handle_reaction_message)),
+        ]))
 
     async def _set_command(self, app: App) -> None:
         bot_command = [
@@ -1043,18 +1308,7 @@ class MyBot:
         """处理 /help 命令"""
         if not update.message:
             return
-        await update.message.reply_text(
-            "/start - 开始验证（验证通过则无返回）\n"
-            "/help - 显示此信息\n"
-            "/d - 撤回一个消息（必须回复一个消息）\n"
-            "/ban - 封禁用户（仅管理员）\n"
-            "/unban - 解封用户（仅管理员）\n"
-            "/info - 获取用户信息/消息细节/Bot信息（仅管理员）\n"
-            "/verify - 手动验证用户（仅管理员）\n"
-            "发送验证码 - 验证\n"
-            "发送消息 - 消息将转发到所有者\n\n"
-            "Copyright (C) 2026 Azusa-Mikan"
-        )
+        await update.message.reply_text(HELP_TEXT)
         return
 
     async def _on_startup(self, app: App) -> None:
@@ -1066,14 +1320,16 @@ class MyBot:
             tg_log.info(f"Telegram Bot API 版本 - {BOT_API_VERSION}")
             await self._set_command(app)
             self.bot_id: int = me.id
+            self._insert_msg_task = asyncio.create_task(self._insert_message_worker())
+            self._captcha_task = asyncio.create_task(self._captcha_producer())
         except Exception as e:
             tg_log.exception("Bot 启动失败")
             raise RuntimeError("启动失败，请检查网络连接或数据库配置") from e
 
     def stop(self, signum: int, frame) -> None:
         tg_log.info("Bot 关闭中 - 请稍候")
-        tg_log.debug(f"信号: {signum}")
-        tg_log.debug(f"当前栈信息: {traceback.format_stack(frame)}")
+        tg_log.debug("信号: %s", signum)
+        tg_log.debug("当前栈信息: %s", traceback.format_stack(frame))
         self.bot.stop_running()
 
     def run(self) -> None:
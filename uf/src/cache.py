@@ -1,64 +1,156 @@
-from typing import Any
+from typing import Any, Awaitable, Callable, Generic, TypeVar
 from datetime import datetime
 import asyncio
+import sys
 import time
-from collections import deque
-from pympler import asizeof
-from hurry.filesize import size
+from collections import deque, OrderedDict
+from uf.src.config import config
 from uf.src.log import cache_log
 
+_MISSING = object()
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+class LRUCache(Generic[K, V]):
+    """有界 LRU 缓存，条目数超过 maxsize 时淘汰最久未访问的键"""
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize: int = maxsize
+        self._data: OrderedDict[K, V] = OrderedDict()
+
+    def get(self, key: K, default: Any = None) -> Any:
+        try:
+            value = self._data[key]
+        except KeyError:
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: K, value: V) -> tuple[K, V] | None:
+        """写入键值，若因此淘汰了最旧的条目则返回被淘汰的 (key, value)"""
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            return self._data.popitem(last=False)
+        return None
+
+    def pop(self, key: K, default: Any = None) -> Any:
+        return self._data.pop(key, default)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._data
+
+    def __sizeof__(self) -> int:
+        return object.__sizeof__(self) + sys.getsizeof(self._data)
+
+class UserState:
+    """
+    单个用户的缓存标记
+
+    未写入过的字段保持未设置状态，get_flag 此时返回调用方给出的默认值，
+    与之前使用 dict 时"键不存在"的语义相同
+    """
+    __slots__ = ("to_topic", "block", "verify", "verify_attempts")
+
+def _state_size(state: UserState) -> int:
+    return sys.getsizeof(state) + sum(
+        sys.getsizeof(getattr(state, name)) for name in UserState.__slots__ if hasattr(state, name)
+    )
+
+def _fmt(n: int) -> str:
+    return f"{n / 1024:.1f}KB"
+
 class DataCache:
     def __init__(self) -> None:
-        self.user_locks: dict[int, asyncio.Lock] = {}
-        self.user_data: dict[int, dict[str, Any]] = {}
-        self.topic_data: dict[int, dict[str, Any]] = {}
-        self.user_message_time_queues: dict[int, deque[float]] = {}
+        # 被淘汰的用户标记会在下次需要时从数据库重新读取
+        self.user_data: LRUCache[int, UserState] = LRUCache(maxsize=config.cache.user_maxsize)
+        self._user_data_bytes: int = 0 # 用户数据的浅层大小，在写入与淘汰时增量维护
+        # 话题 -> 用户的映射在话题创建后不再变化，用有界 LRU 常驻缓存即可，无需失效
+        self.topic_data: LRUCache[int, dict[str, Any]] = LRUCache(maxsize=config.cache.topic_maxsize)
+        self.user_message_time_queues: LRUCache[int, deque[float]] = LRUCache(maxsize=config.cache.user_maxsize)
+        self.user_queues: dict[int, asyncio.Queue[Callable[[], Awaitable[None]]]] = {}
+        self._user_workers: set[asyncio.Task[None]] = set()
+        self.worker_idle: float = 60.0
+        self.flood_maxlen: int = 64 # 每个用户最多保留的消息时间戳数量，刷屏判定的阈值远小于此值
         self.startup_time: datetime = datetime.now()
     
-    def get_user_lock(self, user_id: int) -> asyncio.Lock:
+    def submit(self, user_id: int, coro_factory: Callable[[], Awaitable[None]]) -> None:
         """
-        根据用户 ID 获取对应的 asyncio.Lock 实例。
+        把任务提交到该用户的 FIFO 队列，立即返回。
         
-        如果该用户尚未在 user_locks 字典中注册，则新建一个 Lock 并缓存；
-        否则直接返回已存在的 Lock。
+        每个用户由一个 worker 按提交顺序逐个执行任务（首次提交时创建），
+        worker 空闲超过 worker_idle 秒后自行退出。
         
         Args:
             user_id (int): 用户唯一标识符。
-        
-        Returns:
-            asyncio.Lock: 与该用户绑定的异步锁对象。
-        """
-        # 尝试从缓存中获取已存在的锁
-        lock = self.user_locks.get(user_id)
-        if lock is None:
-            # 若不存在，则新建一个锁
-            lock = asyncio.Lock()
-            # 使用 setdefault 确保线程安全地写入缓存
-            lock = self.user_locks.setdefault(user_id, lock)
-            cache_log.debug(f"为 {user_id} 创建了新的异步锁")
-        else:
-            cache_log.debug(f"{user_id} 异步锁缓存被命中")
-        return lock
+            coro_factory (Callable[[], Awaitable[None]]): 被调用时返回要执行的协程。
+        """
+        q = self.user_queues.get(user_id)
+        if q is None:
+            q = asyncio.Queue()
+            self.user_queues[user_id] = q
+            t = asyncio.create_task(self._user_worker(user_id, q))
+            self._user_workers.add(t)
+            t.add_done_callback(self._user_workers.discard)
+            cache_log.debug("为 %s 创建了任务队列", user_id)
+        q.put_nowait(coro_factory)
+
+    async def _user_worker(self, user_id: int, q: asyncio.Queue[Callable[[], Awaitable[None]]]) -> None:
+        """按顺序执行单个用户的任务，同一用户的任务只由这一个 worker 执行，彼此天然互斥"""
+        while True:
+            try:
+                coro_factory = await asyncio.wait_for(q.get(), timeout=self.worker_idle)
+            except asyncio.TimeoutError:
+                # wait_for 超时后还要等待 q.get() 取消完成，期间 submit 仍可能把任务放进队列
+                if not q.empty():
+                    continue
+                # 确认队列为空到 pop 之间没有 await，此后的 submit 会创建新的队列与 worker
+                self.user_queues.pop(user_id, None)
+                cache_log.debug("%s 任务队列空闲，worker 已退出", user_id)
+                return
+
+            try:
+                await coro_factory()
+            except Exception:
+                cache_log.exception(f"{user_id} 的任务执行失败")
+            finally:
+                q.task_done()
+
+    async def drain(self) -> None:
+        """等待所有用户队列中已提交的任务执行完毕，然后停止全部 worker"""
+        await asyncio.gather(*(q.join() for q in list(self.user_queues.values())))
+        for t in list(self._user_workers):
+            t.cancel()
     
-    def _get_user_data(self, user_id: int) -> dict[str, Any]:
+    def _get_user_data(self, user_id: int) -> UserState:
         """
         根据用户 ID 获取对应的缓存数据。
         
-        如果该用户尚未在 user_data 字典中注册，则新建一个空字典并缓存；
-        否则直接返回已存在的字典。
+        如果该用户尚未在 user_data 字典中注册，则新建一个空的 UserState 并缓存；
+        否则直接返回已存在的 UserState。
         
         Args:
             user_id (int): 用户唯一标识符。
         
         Returns:
              
-            dict[str, Any]: 与该用户绑定的缓存数据字典。
+            UserState: 与该用户绑定的缓存数据。
         """
         data = self.user_data.get(user_id)
         if data is None:
-            data = {}
-            self.user_data[user_id] = data
-            cache_log.debug(f"为 {user_id} 创建了缓存")
+            data = UserState()
+            evicted = self.user_data.set(user_id, data)
+            if evicted is not None:
+                self._user_data_bytes -= _state_size(evicted[1])
+                cache_log.debug("%s 的缓存被淘汰", evicted[0])
+            self._user_data_bytes += sys.getsizeof(data)
+            cache_log.debug("为 %s 创建了缓存", user_id)
         return data
 
     def _get_user_message_time_queue(self, user_id: int) -> deque[float]:
@@ -68,15 +160,16 @@ class DataCache:
         """
         q = self.user_message_time_queues.get(user_id)
         if q is None:
-            q = deque()
-            self.user_message_time_queues[user_id] = q
+            q = deque(maxlen=self.flood_maxlen)
+            self.user_message_time_queues.set(user_id, q)
         return q
 
     def flood_message(self, user_id: int, window: float = 4.0) -> int:
         """记录一次消息并返回该用户在窗口期内的消息数量。
 
         - 使用 time.monotonic()：不受系统时间回拨影响，适合做限流窗口。
-        - 复杂度：均摊 O(1)。每条时间戳最多 append 一次、popleft 一次。
+        - 复杂度：均摊 O(1)。队列长度不超过 flood_maxlen，单次清理最多弹出 flood_maxlen 条；
+          返回值同样以 flood_maxlen 为上限。
 
         Args:
             user_id: Telegram 用户 ID
@@ -87,6 +180,9 @@ class DataCache:
 
         now = time.monotonic()
         q = self._get_user_message_time_queue(user_id)
+        # 最新的时间戳都已在窗口外时整个队列都已过期，直接清空
+        if q and (now - q[-1]) > window:
+            q.clear()
         q.append(now)
 
         # 清理窗口外的历史时间戳
@@ -116,8 +212,8 @@ class DataCache:
         data = self.topic_data.get(topic_id)
         if data is None:
             data = {}
-            self.topic_data[topic_id] = data
-            cache_log.debug(f"为 {topic_id} 创建了缓存")
+            self.topic_data.set(topic_id, data)
+            cache_log.debug("为 %s 创建了缓存", topic_id)
         return data
 
     def get_flag(self, user_id: int, key: str, default: Any = None) -> Any:
@@ -133,9 +229,8 @@ class DataCache:
             Any: 对应的值，若键不存在则返回默认值。
         """
         data = self._get_user_data(user_id)
-        cache_log.debug(f"{user_id} 缓存被命中")
-        cache_log.debug(f"为 {user_id} 获取的内容: {key}")
-        return data.get(key, default)
+        cache_log.debug("%s 缓存被命中，获取的内容: %s", user_id, key)
+        return getattr(data, key, default)
 
     def set_flag(self, user_id: int, key: str, value: Any) -> None:
         """
@@ -143,13 +238,19 @@ class DataCache:
         
         Args:
             user_id (int): 用户唯一标识符。
-            key (str): 缓存键名。
+            key (str): 缓存键名，必须是 UserState 中定义的字段。
             value (Any): 对应的值。
+        
+        Raises:
+            AttributeError: key 不是 UserState 中定义的字段。
         """
         data = self._get_user_data(user_id)
-        data[key] = value
-        cache_log.debug(f"{user_id} 缓存被更新")
-        cache_log.debug(f"为 {user_id} 设置的内容: {key} = {value}")
+        old = getattr(data, key, _MISSING)
+        setattr(data, key, value)
+        if old is not _MISSING:
+            self._user_data_bytes -= sys.getsizeof(old)
+        self._user_data_bytes += sys.getsizeof(value)
+        cache_log.debug("%s 缓存被更新，设置的内容: %s = %s", user_id, key, value)
     
     def get_topic(self, topic_id: int, key: str, default: Any = None) -> Any:
         """
@@ -164,8 +265,7 @@ class DataCache:
             Any: 对应的值，若键不存在则返回默认值。
         """
         data = self._get_topic_data(topic_id)
-        cache_log.debug(f"{topic_id} 缓存被命中")
-        cache_log.debug(f"为 {topic_id} 获取的内容: {key}")
+        cache_log.debug("%s 缓存被命中，获取的内容: %s", topic_id, key)
         return data.get(key, default)
 
     def set_topic(self, topic_id: int, key: str, value: Any) -> None:
@@ -179,31 +279,33 @@ class DataCache:
         """
         data = self._get_topic_data(topic_id)
         data[key] = value
-        cache_log.debug(f"{topic_id} 缓存被更新")
-        cache_log.debug(f"为 {topic_id} 设置的内容: {key} = {value}")
+        cache_log.debug("%s 缓存被更新，设置的内容: %s = %s", topic_id, key, value)
     
-    def get_cache_size(self) -> tuple[Any | str, Any | str, Any | str, Any | str]:
+    def get_cache_size(self) -> tuple[str, str, str, str]:
         """
-        获取当前缓存占用的内存大小。
+        获取当前缓存的条目数与估算的内存大小。
+        
+        不再遍历整个对象图：用户数据使用写入时增量维护的字节数，
+        其余缓存的每个条目大小固定，只报告条目数与顶层容器的大小。
         
         Returns:
              
-            tuple[Any | str, Any | str, Any | str, Any | str]: 顺序：用户锁、用户数据、话题数据、用户消息时间队列占用的内存大小。
+            tuple[str, str, str, str]: 顺序：用户任务队列、用户数据、话题数据、用户消息时间队列。
              
-            每个元素都是一个字符串，格式为 "{size}{unit}"，例如 "123B"。
+            每个元素都是一个字符串，格式为 "{条目数} 项 / {size}KB"，例如 "12 项 / 1.2KB"。
         """
         return (
-            size(asizeof.asizeof(self.user_locks)),
-            size(asizeof.asizeof(self.user_data)),
-            size(asizeof.asizeof(self.topic_data)),
-            size(asizeof.asizeof(self.user_message_time_queues)),
+            f"{len(self.user_queues)} 项 / {_fmt(sys.getsizeof(self.user_queues))}",
+            f"{len(self.user_data)} 项 / {_fmt(sys.getsizeof(self.user_data) + self._user_data_bytes)}",
+            f"{len(self.topic_data)} 项 / {_fmt(sys.getsizeof(self.topic_data))}",
+            f"{len(self.user_message_time_queues)} 项 / {_fmt(sys.getsizeof(self.user_message_time_queues))}",
         )
 
     def clear_user_all(self) -> None:
         self.user_data.clear()
-        self.user_locks.clear()
-        cache_log.debug(f"所有用户缓存被清除")
+        self._user_data_bytes = 0
+        cache_log.debug("所有用户缓存被清除")
     
     def clear_topic_all(self) -> None:
         self.topic_data.clear()
-        cache_log.debug(f"所有话题缓存被清除")
+        cache_log.debug("所有话题缓存被清除")
@@ -41,6 +41,15 @@ class OpenAIConfig(BaseModel):
     rpm: int = Field(default=5, gt=0, description="请求次数（相对于时间窗口）")
     time_period: int = Field(default=30, gt=0, description="时间窗口（秒）")
 
+class CacheConfig(BaseModel):
+    model_config = ConfigDict(
+        extra='forbid',
+        frozen=True
+    )
+
+    user_maxsize: int = Field(default=10000, gt=0, description="内存中最多缓存的用户数，超出后淘汰最久未活跃的用户")
+    topic_maxsize: int = Field(default=50000, gt=0, description="内存中最多缓存的话题数，超出后淘汰最久未访问的话题")
+
 class BotConfig(BaseModel):
     model_config = ConfigDict(
         extra='forbid',
@@ -51,14 +60,18 @@ class BotConfig(BaseModel):
     telegram: TGConfig = Field(default_factory=TGConfig)
     database: DatabaseConfig = Field(default_factory=DatabaseConfig)
     openai: OpenAIConfig = Field(default_factory=OpenAIConfig)
+    cache: CacheConfig = Field(default_factory=CacheConfig)
 
 config_path = Path(__file__).parents[2] / "config" / "config.yaml"
 if not config_path.parent.exists():
     config_path.parent.mkdir(parents=True, exist_ok=True)
 
+# 优先使用 libyaml 的 C 实现，未编译 libyaml 时回退到纯 Python 实现
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 if config_path.exists():
     with open(config_path, "r", encoding="utf-8") as f:
-        config_data = yaml.safe_load(f) or {}
+        config_data = yaml.load(f, Loader=SafeLoader) or {}
         config = BotConfig(**config_data)
 else:
     default_config = BotConfig()
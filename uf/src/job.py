@@ -11,7 +11,7 @@ App = Application[ExtBot[None], Context, UserData, ChatData, BotData, JobQueue[C
 
 class TGBot(MyBot):
     async def _cleanup_cache_job(self, context: Context) -> None:
-        self.cache.clear_topic_all()
+        # 话题缓存是有界 LRU 且映射不会变化，无需每日清理
         self.cache.clear_user_all()
 
     async def _cleanup_db_job(self, context: Context) -> None:
@@ -1,5 +1,7 @@
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+import atexit
+import queue
 import sys
 import colorlog
 from pathlib import Path
@@ -76,6 +78,27 @@ file_handler_ai = RotatingFileHandler(
 file_handler_ai.setLevel(logging.DEBUG)
 file_handler_ai.setFormatter(file_formatter)
 
+def _queued(handler: logging.Handler) -> QueueHandler:
+    """
+    把实际执行 I/O 的 handler 移到后台线程
+
+    调用方只把日志记录放入队列，终端与文件的写入由 QueueListener 线程完成
+    """
+    q: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    queue_handler = QueueHandler(q)
+    queue_handler.setLevel(handler.level) # 在入队前就过滤掉不会被输出的记录
+    queue_handler.setFormatter(logging.Formatter("%(message)s")) # 只展开消息与异常，格式由实际的 handler 决定
+    listener = QueueListener(q, handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop) # 退出时写完队列中剩余的日志
+    return queue_handler
+
+console_handler = _queued(console_handler)
+file_handler_tg = _queued(file_handler_tg)
+file_handler_sql = _queued(file_handler_sql)
+file_handler_cache = _queued(file_handler_cache)
+file_handler_ai = _queued(file_handler_ai)
+
 logging.basicConfig(
     level=logging.DEBUG,
     handlers=[
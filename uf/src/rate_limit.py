@@ -0,0 +1,130 @@
+from typing import Any, Callable, Coroutine
+from collections import deque
+import asyncio
+import contextlib
+import time
+
+from aiolimiter import AsyncLimiter
+from telegram.constants import FloodLimit
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from uf.src.log import tg_log
+
+JSONDict = dict[str, Any]
+ChatKey = int | str | None
+
+class GroupAwareLimiter(BaseRateLimiter[int]):
+    """
+    按 chat 隔离的限流器
+
+    - 群组/频道：每个 chat 一个独立的固定窗口计数（默认 60 秒内最多 20 条）
+    - 全局：AsyncLimiter 令牌桶（默认每秒 30 条），仅作用于带 chat_id 的请求
+    - RetryAfter 只暂停触发它的 chat，其它 chat（例如私聊）照常发送
+    """
+    def __init__(
+            self,
+            overall_max_rate: float = FloodLimit.MESSAGES_PER_SECOND,
+            overall_time_period: float = 1,
+            group_max_rate: int = FloodLimit.MESSAGES_PER_MINUTE_PER_GROUP,
+            group_time_period: float = 60,
+            max_retries: int = 0,
+        ) -> None:
+        self._base_limiter = AsyncLimiter(overall_max_rate, overall_time_period)
+        self._group_max_rate: int = group_max_rate
+        self._group_time_period: float = group_time_period
+        self._group_windows: dict[ChatKey, deque[float]] = {}
+        self._paused_until: dict[ChatKey, float] = {}
+        self._max_retries: int = max_retries
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _get_group_window(self, group: ChatKey) -> deque[float]:
+        if len(self._group_windows) > 512:
+            # 清理已经没有窗口内请求的群组，避免字典无限增长
+            now = time.monotonic()
+            for key, q in list(self._group_windows.items()):
+                if key != group and (not q or now - q[-1] >= self._group_time_period):
+                    del self._group_windows[key]
+
+        q = self._group_windows.get(group)
+        if q is None:
+            q = deque()
+            self._group_windows[group] = q
+        return q
+
+    async def _wait_group_window(self, group: ChatKey) -> None:
+        """等待该群组的固定窗口中出现空位并占用它"""
+        q = self._get_group_window(group)
+        while True:
+            now = time.monotonic()
+            while q and now - q[0] >= self._group_time_period:
+                q.popleft()
+            # 判断与占位之间没有 await，并发请求不会超出上限
+            if len(q) < self._group_max_rate:
+                q.append(now)
+                return
+            await asyncio.sleep(self._group_time_period - (now - q[0]))
+
+    async def _wait_retry_after(self, chat: ChatKey) -> None:
+        """如果该 chat 正处于 RetryAfter 暂停中，等待暂停结束"""
+        while True:
+            delay = self._paused_until.get(chat, 0) - time.monotonic()
+            if delay <= 0:
+                self._paused_until.pop(chat, None)
+                return
+            await asyncio.sleep(delay)
+
+    async def _run_request(
+            self,
+            chat: ChatKey,
+            group: ChatKey,
+            callback: Callable[..., Coroutine[Any, Any, bool | JSONDict | list[JSONDict]]],
+            args: Any,
+            kwargs: dict[str, Any],
+        ) -> bool | JSONDict | list[JSONDict]:
+        await self._wait_retry_after(chat)
+        if group is not None and self._group_max_rate:
+            await self._wait_group_window(group)
+        if chat is None:
+            return await callback(*args, **kwargs)
+        async with self._base_limiter:
+            return await callback(*args, **kwargs)
+
+    async def process_request(
+            self,
+            callback: Callable[..., Coroutine[Any, Any, bool | JSONDict | list[JSONDict]]],
+            args: Any,
+            kwargs: dict[str, Any],
+            endpoint: str,
+            data: dict[str, Any],
+            rate_limit_args: int | None,
+        ) -> bool | JSONDict | list[JSONDict]:
+        max_retries = rate_limit_args or self._max_retries
+
+        chat: ChatKey = data.get("chat_id")
+        with contextlib.suppress(ValueError, TypeError):
+            chat = int(chat) # type: ignore[arg-type]
+
+        # 负数 ID 与 @username 均视为群组/频道
+        group: ChatKey = chat if (isinstance(chat, int) and chat < 0) or isinstance(chat, str) else None
+
+        for i in range(max_retries + 1):
+            try:
+                return await self._run_request(chat, group, callback, args, kwargs)
+            except RetryAfter as e:
+                if i == max_retries:
+                    tg_log.error(f"{endpoint} 在 chat {chat} 重试 {max_retries} 次后仍被限流")
+                    raise
+                # 与 PTB 的 AIORateLimiter 相同，直接读取 timedelta，避免 retry_after 属性的弃用警告
+                sleep = e._retry_after.total_seconds() + 0.1
+                tg_log.warning(f"chat {chat} 触发限流，{sleep:.1f}s 后重试")
+                self._paused_until[chat] = max(
+                    self._paused_until.get(chat, 0),
+                    time.monotonic() + sleep,
+                )
+        raise RuntimeError("unreachable")
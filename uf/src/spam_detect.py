@@ -1,15 +1,44 @@
 from pathlib import Path
 import asyncio
-from openai import AsyncOpenAI, OpenAIError
+import re
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, OpenAIError
 from pydantic import BaseModel, ConfigDict, ValidationError
 from aiolimiter import AsyncLimiter
 from time import perf_counter
 
+from uf.src.cache import LRUCache
 from uf.src.config import config
 from uf.src.log import ai_log
 
 detect_path = Path(__file__).resolve().parent / "assets" / "prohibited_words.txt"
-prohibited_words: list[str] = detect_path.read_text(encoding="utf-8").splitlines()
+# 去重并丢弃空行（空字符串会匹配任意文本），按长度排序使前缀树的构建结果稳定
+prohibited_words: tuple[str, ...] = tuple(sorted(
+    frozenset(w for w in detect_path.read_text(encoding="utf-8").splitlines() if w),
+    key=lambda w: (len(w), w),
+))
+
+def _trie_pattern(node: dict[str, dict]) -> str:
+    """把前缀树转换为正则，公共前缀只出现一次，匹配时每个位置沿树向下走"""
+    end = "" in node
+    alts = [re.escape(ch) + _trie_pattern(child) for ch, child in sorted(node.items()) if ch]
+    if not alts:
+        return ""
+    if len(alts) == 1 and not end:
+        return alts[0]
+    return "(?:" + "|".join(alts) + ")" + ("?" if end else "")
+
+def _build_words_pattern(words: tuple[str, ...]) -> re.Pattern[str] | None:
+    trie: dict[str, dict] = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+    return re.compile(_trie_pattern(trie)) if trie else None
+
+# 所有关键词编译为一个前缀树正则，一次扫描完成匹配
+prohibited_pattern = _build_words_pattern(prohibited_words)
 
 global_prompt = (
     "You are a Telegram message moderation detector. "
@@ -40,6 +69,10 @@ global_prompt = (
     "Output: {\"spam\": false, \"reason\": \"正常提问交流，未见违规。\"}"
 )
 
+# 请求中不变的部分只构建一次
+_JSON_FORMAT = {"type": "json_object"}
+_SYS_MSG = {"role": "system", "content": global_prompt}
+
 class Spam(BaseModel):
     model_config = ConfigDict(
         extra='forbid'
@@ -53,14 +86,30 @@ class SpamDetector:
         self.base_url: str = self._replace_base_url(config.openai.base_url)
         self.model: str = config.openai.model
         self.token: str = config.openai.token
+        # 保持长连接，突发请求复用已建立的 TLS 连接
         self.client = AsyncOpenAI(
             api_key=self.token,
             base_url=self.base_url,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_keepalive_connections=20,
+                    max_connections=max(config.openai.rpm * 2, 10),
+                    keepalive_expiry=120,
+                ),
+                timeout=40.0,
+            ),
         )
         self.limiter = AsyncLimiter(
             config.openai.rpm,
             config.openai.time_period,
         )
+        # 复制粘贴的广告常被不同用户重复发送，缓存 AI 的判定结果，命中时不再占用限流额度
+        # 键为去除首尾空白后的完整文本；只缓存 AI 成功给出的结果，回退到关键词的结果不缓存
+        self._results: LRUCache[str, tuple[float, tuple[bool, str]]] = LRUCache(maxsize=4096)
+        self.result_ttl: float = 3600.0
+
+    async def close(self) -> None:
+        await self.client.close()
 
     def _replace_base_url(self, url: str) -> str:
         if url.endswith('/'):
@@ -74,18 +123,11 @@ class SpamDetector:
         if waited >= 0.1:
             ai_log.warning(f"AI 请求触发限流，已等待 {waited:.2f}s")
         else:
-            ai_log.debug(f"AI 请求通过限流器（wait={waited:.2f}s）")
-        if config.openai.json_mode:
-            response_format = {"type": "json_object"}
-        else:
-            response_format = None
+            ai_log.debug("AI 请求通过限流器（wait=%.2fs）", waited)
         coro = self.client.chat.completions.create(
             model=self.model,
             messages=[
-                {
-                    "role": "system",
-                    "content": global_prompt,
-                },
+                _SYS_MSG, # type: ignore
                 {
                     "role": "user",
                     "content": text,
@@ -93,32 +135,57 @@ class SpamDetector:
             ],
             stream=False,
             temperature=0,
-            response_format=response_format, # type: ignore
+            response_format=_JSON_FORMAT if config.openai.json_mode else None, # type: ignore
         )
         response = await asyncio.wait_for(coro, 40.0)
         msg = response.choices[0].message
         answer = msg.content
         reasoning = getattr(msg, "reasoning", None) or getattr(msg, "reasoning_content", None)
-        ai_log.debug(f"AI思考内容：{reasoning!r}")
-        ai_log.debug(f"AI输出内容：{answer!r}")
+        ai_log.debug("AI思考内容：%r", reasoning)
+        ai_log.debug("AI输出内容：%r", answer)
         return answer
     
     def _detect_of_words(self, text: str) -> Spam:
-        word = next((w for w in prohibited_words if w in text), None)
-        if word is not None:
-            ai_log.debug(f"触发关键词: {word}")
+        match = prohibited_pattern.search(text) if prohibited_pattern else None
+        if match is not None:
+            word = match.group()
+            ai_log.debug("触发关键词: %s", word)
             return Spam(spam=True, reason=f"触发关键词: {word}")
         return Spam(spam=False, reason="未触发任何关键词")
     
+    def _get_result(self, text: str) -> tuple[bool, str] | None:
+        hit = self._results.get(text.strip())
+        if hit is None:
+            return None
+        expires, result = hit
+        if expires < perf_counter():
+            self._results.pop(text.strip())
+            return None
+        return result
+
+    def _set_result(self, text: str, result: tuple[bool, str]) -> None:
+        self._results.set(text.strip(), (perf_counter() + self.result_ttl, result))
+
     async def check_spam(self, text: str) -> tuple[bool, str]:
         if not self.token or not self.base_url or not self.model:
             ai_log.warning("未正确设置AI相关设置，已回退到关键词判断")
             spam = self._detect_of_words(text)
             return spam.spam, spam.reason
 
+        # 命中关键词的消息直接判定，不占用限流额度也不调用 AI
+        pre = self._detect_of_words(text)
+        if pre.spam:
+            return pre.spam, pre.reason
+
+        cached = self._get_result(text)
+        if cached is not None:
+            ai_log.debug("AI 判定结果缓存被命中")
+            return cached
+
         try:
             response = await self._detect_of_openai(text)
             spam = Spam.model_validate_json(response) # type: ignore
+            self._set_result(text, (spam.spam, spam.reason))
         except asyncio.TimeoutError:
             ai_log.error("AI调用超时，已回退到关键词判断")
             spam = self._detect_of_words(text)
@@ -133,6 +200,3 @@ class SpamDetector:
             raise
 
         return spam.spam, spam.reason
-
-
-
@@ -1,5 +1,5 @@
 import sys
-from sqlalchemy import text
+from sqlalchemy import event, text
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from pathlib import Path
@@ -23,11 +23,14 @@ match config.database.type:
 try:
     match config.database.type:
         case "sqlite":
+            # WAL 模式下读连接之间互不阻塞，写入由 busy_timeout 排队；
+            # 连接长期保留在池中，页面缓存在查询之间保持有效
             engine = create_async_engine(
                 DATABASE_URL,
                 echo=False,
-                pool_size=1,
-                max_overflow=0,
+                pool_size=5,
+                max_overflow=10,
+                pool_recycle=3600,
                 connect_args={"timeout": 30},
             )
         case "mysql" | "mariadb" | "postgresql":
@@ -60,7 +63,26 @@ except Exception as e:
     sql_log.critical(f"数据库连接失败: {e}")
     raise
 
-SessionLocal = async_sessionmaker(bind=engine, autoflush=True)
+if engine.dialect.name == "sqlite":
+    # 除 journal_mode 外，这些 PRAGMA 只对当前连接生效，每个新连接都需要重新设置
+    # busy_timeout 与连接参数中的 timeout（30 秒）保持一致，不缩短等待锁的时间
+    @event.listens_for(engine.sync_engine, "connect")
+    def _set_sqlite_pragma(dbapi_connection, connection_record) -> None:
+        cursor = dbapi_connection.cursor()
+        for pragma in (
+            "PRAGMA synchronous=NORMAL",
+            "PRAGMA temp_store=MEMORY",
+            "PRAGMA mmap_size=268435456", # 256MB
+            "PRAGMA cache_size=-65536", # 64MB
+            "PRAGMA busy_timeout=30000",
+            "PRAGMA wal_autocheckpoint=1000",
+        ):
+            cursor.execute(pragma)
+        cursor.close()
+
+# 仓库方法中的写入都显式 flush，不需要在每次查询前自动 flush；
+# 提交后不过期实体，返回给调用方的对象在会话关闭后仍可直接读取属性，不会触发重新查询
+SessionLocal = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
 
 class Base(DeclarativeBase):
     pass
@@ -69,13 +91,20 @@ async def init_db():
     async with engine.begin() as conn:
         if conn.dialect.name == "sqlite":
             await conn.execute(text("PRAGMA journal_mode=WAL"))
-            await conn.execute(text("PRAGMA synchronous=NORMAL"))
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_create_missing_indexes)
+
+def _create_missing_indexes(sync_conn) -> None:
+    """create_all 不会为已存在的表补建索引，这里逐个检查并创建新增的索引"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
 
 async def healthy() -> tuple[bool, str]:
     try:
-        async with engine.begin() as conn:
-            await conn.execute(text("SELECT 1"))
+        # 只读探测不需要显式事务，直接在池中的连接上执行
+        async with engine.connect() as conn:
+            await conn.exec_driver_sql("SELECT 1")
         
         return True, ""
     except Exception as e:
@@ -1,4 +1,4 @@
-from sqlalchemy import UniqueConstraint, Integer, BigInteger, String, DateTime, Boolean
+from sqlalchemy import Index, UniqueConstraint, Integer, BigInteger, String, DateTime, Boolean
 from sqlalchemy.orm import Mapped, mapped_column
 
 from datetime import datetime
@@ -14,6 +14,15 @@ class Verify(Base):
     expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, index=True, comment="过期时间")
     verified: Mapped[bool] = mapped_column(Boolean, nullable=False, comment="是否验证")
 
+# 统计已验证用户时只需扫描已验证的行；SQLite 与 PostgreSQL 使用部分索引，MySQL 退化为普通索引
+Index(
+    "ix_verify_users_verified",
+    Verify.verified,
+    Verify.userid,
+    sqlite_where=Verify.verified.is_(True),
+    postgresql_where=Verify.verified.is_(True),
+)
+
 class Block(Base):
     __tablename__ = "block_users"
 
@@ -35,6 +44,15 @@ class Messages(Base):
     reason: Mapped[str] = mapped_column(String(256), nullable=False, comment="理由")
     time: Mapped[datetime] = mapped_column(DateTime, nullable=False, index=True, comment="消息时间")
 
+# (userid, private_message_id) 的查询由唯一约束自带的索引覆盖，这里只补充统计垃圾消息所需的索引
+Index(
+    "ix_messages_spam_time",
+    Messages.spam,
+    Messages.time,
+    sqlite_where=Messages.spam.is_(True),
+    postgresql_where=Messages.spam.is_(True),
+)
+
 class Users(Base):
     __tablename__ = "users"
 
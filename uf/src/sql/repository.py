@@ -1,27 +1,261 @@
 from datetime import datetime, timedelta
+import asyncio
+import inspect
 
-from sqlalchemy import select, delete, func
+from sqlalchemy import select, update, delete, exists, func, literal, bindparam
+from sqlalchemy.dialects import mysql, postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
 
-from uf.src.sql import SessionLocal
+from uf.src.sql import SessionLocal, engine
 from uf.src.sql.model import Verify, Block, Messages, Users, RuntimeSettings
 
-from typing import Any, AsyncIterator, Literal
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Awaitable, Callable, Literal, NamedTuple, Sequence, TypeVar
 from contextlib import asynccontextmanager
+from functools import wraps
+
+from uf.src.cache import LRUCache
+
+T = TypeVar("T")
+_MISSING = object()
+
+# 热点查询的语句在模块加载时构建一次，每次调用只绑定参数；
+# 语句对象不变，SQLAlchemy 的缓存键也只需计算一次
+_SELECT_VERIFY = select(Verify).where(Verify.userid == bindparam("userid"))
+_SELECT_VERIFIED = select(Verify.verified).where(Verify.userid == bindparam("userid"))
+_SELECT_USER_BY_ID = select(Users).where(Users.userid == bindparam("id"))
+_SELECT_USER_BY_TOPIC = select(Users).where(Users.topic == bindparam("id"))
+_SELECT_USER_STATE = select(
+    exists().where(Block.userid == bindparam("userid")).label("blocked"),
+    select(Users.topic).where(Users.userid == bindparam("userid")).scalar_subquery().label("topic"),
+    select(Verify.verified).where(Verify.userid == bindparam("userid")).scalar_subquery().label("verified"),
+)
+_SELECT_BLOCK_EXISTS = select(literal(1)).select_from(Block).where(Block.userid == bindparam("userid")).limit(1)
+_SELECT_BLOCK = select(Block).where(Block.userid == bindparam("userid"))
+# 删除时直接按键执行 DELETE，不需要把实体重新加载到写会话中
+_DELETE_BLOCK = delete(Block).where(Block.userid == bindparam("userid"))
+_DELETE_MESSAGE = delete(Messages).where(Messages.id == bindparam("id"))
+_SELECT_MESSAGE_BY_TOPIC = select(Messages).where(Messages.topic_message_id == bindparam("msg_id"))
+_SELECT_MESSAGE_BY_PRIVATE = select(Messages).where(
+    Messages.userid == bindparam("userid"),
+    Messages.private_message_id == bindparam("msg_id"),
+)
+
+def _insert_ignore(model: Any) -> Any:
+    """
+    按数据库方言构建一条遇到唯一键冲突时跳过该行的 INSERT
+
+    Args:
+        model (Any): ORM 模型
+
+    Returns:
+        Any: 可配合单行或多行参数执行的 INSERT 语句
+    """
+    match engine.dialect.name:
+        case "sqlite":
+            return sqlite.insert(model).on_conflict_do_nothing()
+        case "postgresql":
+            return postgresql.insert(model).on_conflict_do_nothing()
+        case "mysql" | "mariadb":
+            return mysql.insert(model).prefix_with("IGNORE")
+        case _:
+            raise ValueError(f"未知数据库类型: {engine.dialect.name}")
+
+# 消息记录以 topic_message_id 或 (userid, private_message_id) 去重，重复写入直接跳过，
+# 不需要 SAVEPOINT，也不需要冲突后再查询已有记录
+_INSERT_MESSAGE_IGNORE = _insert_ignore(Messages)
+
+class UserStatus(NamedTuple):
+    blocked: bool
+    topic: int | None
+    verified: bool
+
+class Stats(NamedTuple):
+    verified: int
+    blocked: int
+    topics: int
+    messages: int
+    spam: int
+
+class _RequestScope:
+    """request_scope 打开的共享会话，只对打开它的任务生效"""
+    __slots__ = ("session", "owner", "invalidated")
+
+    def __init__(self, session: AsyncSession, owner: asyncio.Task[Any] | None) -> None:
+        self.session = session
+        self.owner = owner
+        self.invalidated: set[tuple[str, int]] = set()
+
+_request_scope: ContextVar[_RequestScope | None] = ContextVar("_uf_request_scope", default=None)
+
+def _current_scope() -> _RequestScope | None:
+    """
+    返回当前任务所在的 request_scope
+
+    create_task 会复制上下文，子任务也能读到变量；只认打开作用域的任务，
+    子任务（例如 single_flight 的查询、并发的 gather）仍然各自使用独立会话
+    """
+    scope = _request_scope.get()
+    if scope is not None and scope.owner is asyncio.current_task():
+        return scope
+    return None
+
+def cached_with_invalidation(
+        namespace: str,
+    ) -> Callable[[Callable[["UFRepository", int], Awaitable[T]]], Callable[["UFRepository", int], Awaitable[T]]]:
+    """
+    按 (namespace, userid) 缓存查询结果，由对应的写方法调用 _invalidate 精确失效，不依赖 TTL
+
+    查询期间如果发生过任何失效，本次结果不写入缓存，避免并发写入后缓存旧值
+    """
+    def decorator(fn: Callable[["UFRepository", int], Awaitable[T]]) -> Callable[["UFRepository", int], Awaitable[T]]:
+        @wraps(fn)
+        async def wrapper(self: "UFRepository", userid: int) -> T:
+            key = (namespace, userid)
+            scope = _current_scope()
+            if scope is not None and key in scope.invalidated:
+                # 作用域内写过这个键且尚未提交，缓存中是旧值，直接在共享会话中查询
+                return await fn(self, userid)
+            hit = self._cache.get(key, _MISSING)
+            if hit is not _MISSING:
+                return hit
+            if scope is not None:
+                return await fn(self, userid)
+            epoch = self._cache_epoch
+            value = await fn(self, userid)
+            if epoch == self._cache_epoch:
+                self._cache.set(key, value)
+            return value
+        return wrapper
+    return decorator
+
+def single_flight(fn: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+    """
+    合并相同参数的并发查询：已有相同查询在执行时，后来的调用直接等待它的结果
+
+    参数按函数签名绑定后再作为键，位置参数与关键字参数写法不同的相同调用也会被合并
+    """
+    signature = inspect.signature(fn)
+
+    @wraps(fn)
+    async def wrapper(self: "UFRepository", *args: Any, **kwargs: Any) -> T:
+        if _current_scope() is not None:
+            # 共享会话中可能有未提交的写入，不与作用域外的查询合并
+            return await fn(self, *args, **kwargs)
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        key = (fn.__name__, *tuple(bound.arguments.values())[1:])
+        fut = self._inflight.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(fn(*bound.args, **bound.kwargs))
+            self._inflight[key] = fut
+            fut.add_done_callback(lambda f: self._inflight.pop(key, None) if self._inflight.get(key) is f else None)
+        # shield：某个调用方被取消时不影响其它等待同一查询的调用方
+        return await asyncio.shield(fut)
+    return wrapper
 
 class UFRepository:
+    def __init__(self) -> None:
+        self._cache: LRUCache[tuple[str, int], Any] = LRUCache(maxsize=10000)
+        self._cache_epoch: int = 0
+        self._inflight: dict[tuple[Any, ...], asyncio.Future[Any]] = {}
+
+    def _invalidate(self, namespace: str, userid: int) -> None:
+        """
+        使 cached_with_invalidation 缓存的 (namespace, userid) 失效，须在事务提交后调用
+
+        同时丢弃正在执行的 single_flight 查询，写入之后的调用不会合并到写入之前开始的查询上；
+        在 request_scope 中调用时推迟到作用域的事务提交之后
+        """
+        scope = _current_scope()
+        if scope is not None:
+            scope.invalidated.add((namespace, userid))
+            return
+        self._cache_epoch += 1
+        self._cache.pop((namespace, userid), None)
+        self._inflight.clear()
+
+    @asynccontextmanager
+    async def request_scope(self) -> AsyncIterator[None]:
+        """
+        在当前任务中共享一个会话与事务，作用域内连续的仓库调用只签出一次连接、提交一次
+
+        作用域内的写入在退出时统一提交，任一调用抛出异常则整体回滚；
+        事务会一直持有到退出，作用域内不要等待网络请求等耗时操作。可以嵌套，内层直接沿用外层
+        """
+        if _current_scope() is not None:
+            yield
+            return
+
+        async with SessionLocal() as session:
+            scope = _RequestScope(session, asyncio.current_task())
+            token = _request_scope.set(scope)
+            try:
+                async with session.begin():
+                    yield
+            finally:
+                _request_scope.reset(token)
+                for namespace, userid in scope.invalidated:
+                    self._invalidate(namespace, userid)
+
     @asynccontextmanager
     async def _on_session(self) -> AsyncIterator[AsyncSession]:
+        scope = _current_scope()
+        if scope is not None:
+            yield scope.session
+            return
         async with SessionLocal() as session:
             async with session.begin():
                 yield session
 
     @asynccontextmanager
     async def _on_session_readonly(self) -> AsyncIterator[AsyncSession]:
+        scope = _current_scope()
+        if scope is not None:
+            yield scope.session
+            return
         async with SessionLocal() as session:
             yield session
     
+    async def _upsert(
+            self,
+            conn: AsyncSession,
+            model: Any,
+            conflict_cols: Sequence[str],
+            values: dict[str, Any],
+            update_cols: Sequence[str],
+        ) -> None:
+        """
+        按数据库方言执行一条 INSERT ... ON CONFLICT/ON DUPLICATE KEY UPDATE
+        
+        Args:
+            conn (AsyncSession): 异步数据库会话
+            model (Any): ORM 模型
+            conflict_cols (Sequence[str]): 冲突判断所用的唯一列（MySQL 使用表上的唯一索引，忽略此参数）
+            values (dict[str, Any]): 要插入的列与值
+            update_cols (Sequence[str]): 冲突时用新值覆盖的列
+        """
+        match engine.dialect.name:
+            case "sqlite":
+                stmt = sqlite.insert(model).values(**values)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=list(conflict_cols),
+                    set_={c: stmt.excluded[c] for c in update_cols},
+                )
+            case "postgresql":
+                stmt = postgresql.insert(model).values(**values)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=list(conflict_cols),
+                    set_={c: stmt.excluded[c] for c in update_cols},
+                )
+            case "mysql" | "mariadb":
+                stmt = mysql.insert(model).values(**values)
+                stmt = stmt.on_duplicate_key_update({c: stmt.inserted[c] for c in update_cols})
+            case _:
+                raise ValueError(f"未知数据库类型: {engine.dialect.name}")
+        await conn.execute(stmt)
+
     async def _flush_nested_ignore_integrity(self, conn: AsyncSession) -> bool:
         """
         尝试在嵌套事务中刷新会话，忽略完整性错误。
@@ -73,24 +307,16 @@ class UFRepository:
         """
         expires_at: datetime = datetime.now() + timedelta(seconds=ttl_seconds)
         async with self._on_session() as conn:
-            stmt = select(Verify).where(Verify.userid == userid)
-            result = await conn.execute(stmt)
-            entity = result.scalar_one_or_none()
-            if not entity:
-                entity = Verify(
-                    userid=userid,
-                    code=code,
-                    expires_at=expires_at,
-                    verified=False,
-                )
-                conn.add(entity)
-            else:
-                entity.code = code
-                entity.expires_at = expires_at
-                entity.verified = False
-
-            await conn.flush()
+            await self._upsert(
+                conn,
+                Verify,
+                conflict_cols=["userid"],
+                values={"userid": userid, "code": code, "expires_at": expires_at, "verified": False},
+                update_cols=["code", "expires_at", "verified"],
+            )
+        self._invalidate("verify", userid)
 
+    @single_flight
     async def select_valid_verify(self, userid: int) -> Verify | None:
         """
         根据用户ID选择有效验证记录
@@ -103,8 +329,7 @@ class UFRepository:
             Verify | None: 如果找到有效验证记录则返回Verify对象，否则返回None
         """
         async with self._on_session_readonly() as conn:
-            stmt = select(Verify).where(Verify.userid == userid)
-            result = await conn.execute(stmt)
+            result = await conn.execute(_SELECT_VERIFY, {"userid": userid})
             return result.scalar_one_or_none()
 
     async def update_verified(self, userid: int, verified: bool) -> None:
@@ -116,12 +341,11 @@ class UFRepository:
             verified (bool): 验证状态
         """
         async with self._on_session() as conn:
-            stmt = select(Verify).where(Verify.userid == userid)
-            result = await conn.execute(stmt)
-            entity = result.scalar_one_or_none()
-            if entity is not None:
-                entity.verified = verified
+            stmt = update(Verify).where(Verify.userid == userid).values(verified=verified)
+            await conn.execute(stmt)
+        self._invalidate("verify", userid)
 
+    @cached_with_invalidation("verify")
     async def select_verified(self, userid: int) -> bool:
         """
         检查用户是否通过验证
@@ -133,14 +357,8 @@ class UFRepository:
             bool: 如果用户通过验证则返回True，否则返回False
         """
         async with self._on_session_readonly() as conn:
-            stmt = select(Verify).where(Verify.userid == userid)
-            result = await conn.execute(stmt)
-            re = result.scalar_one_or_none()
-
-            if not re:
-                return False
-
-            return re.verified
+            result = await conn.execute(_SELECT_VERIFIED, {"userid": userid})
+            return bool(result.scalar_one_or_none())
 
     async def update_verify_code(self, userid: int, code: str, ttl_seconds: int) -> None:
         """
@@ -152,12 +370,13 @@ class UFRepository:
             ttl_seconds (int): 验证码过期时间（秒）
         """
         async with self._on_session() as conn:
-            stmt = select(Verify).where(Verify.userid == userid)
-            result = await conn.execute(stmt)
-            entity = result.scalar_one_or_none()
-            if entity is not None:
-                entity.code = code
-                entity.expires_at = datetime.now() + timedelta(seconds=ttl_seconds)
+            stmt = (
+                update(Verify)
+                .where(Verify.userid == userid)
+                .values(code=code, expires_at=datetime.now() + timedelta(seconds=ttl_seconds))
+            )
+            await conn.execute(stmt)
+        self._invalidate("verify", userid)
 
     async def insert_user(
             self,
@@ -201,9 +420,10 @@ class UFRepository:
                 topic=topic,
                 first_active_time=datetime.now(),
             )
-            if not await self._add_and_flush_nested_ignore_integrity(conn, entity):
-                return
+            await self._add_and_flush_nested_ignore_integrity(conn, entity)
+        self._invalidate("user", userid)
 
+    @single_flight
     async def select_user(self, id: int, type: Literal['userid', 'topic']) -> Users | None:
         """
         根据用户ID或话题ID获取映射关系
@@ -217,13 +437,29 @@ class UFRepository:
             Users | None: 如果找到映射关系则返回Users对象，否则返回None
         """
         async with self._on_session_readonly() as conn:
-            if type == 'userid':
-                stmt = select(Users).where(Users.userid == id)
-            else:
-                stmt = select(Users).where(Users.topic == id)
-            result = await conn.execute(stmt)
+            stmt = _SELECT_USER_BY_ID if type == 'userid' else _SELECT_USER_BY_TOPIC
+            result = await conn.execute(stmt, {"id": id})
             return result.scalar_one_or_none()
 
+    async def select_user_state(self, userid: int) -> UserStatus:
+        """
+        一次查询获取用户的封禁状态、话题ID与验证状态
+        
+        Args:
+            userid (int): 用户ID
+        
+        Returns:
+             
+            UserStatus: 是否被封禁、对应的话题ID（尚未创建话题时为None）、是否通过验证
+        """
+        async with self._on_session_readonly() as conn:
+            row = (await conn.execute(_SELECT_USER_STATE, {"userid": userid})).one()
+            return UserStatus(
+                blocked=bool(row.blocked),
+                topic=row.topic,
+                verified=bool(row.verified),
+            )
+
     async def insert_block(self, userid: int, pinned_msg_id: int | None = None) -> None:
         """
         封禁用户
@@ -247,8 +483,10 @@ class UFRepository:
                 pinned_msg_id=pinned_msg_id,
             )
             await self._add_and_flush_nested_ignore_integrity(conn, entity)
-            return
+        self._invalidate("block", userid)
 
+    @cached_with_invalidation("block")
+    @single_flight
     async def select_block(self, userid: int) -> bool:
         """
         检查用户是否被封禁
@@ -260,9 +498,8 @@ class UFRepository:
             bool: 如果用户被封禁则返回True，否则返回False
         """
         async with self._on_session_readonly() as conn:
-            stmt = select(Block).where(Block.userid == userid)
-            result = await conn.execute(stmt)
-            return result.scalar_one_or_none() is not None
+            result = await conn.execute(_SELECT_BLOCK_EXISTS, {"userid": userid})
+            return result.scalar() is not None
 
     async def select_block_raw(self, userid: int) -> Block | None:
         """
@@ -276,13 +513,19 @@ class UFRepository:
             Block | None: 如果找到映射关系则返回Block对象，否则返回None
         """
         async with self._on_session_readonly() as conn:
-            stmt = select(Block).where(Block.userid == userid)
-            result = await conn.execute(stmt)
+            result = await conn.execute(_SELECT_BLOCK, {"userid": userid})
             return result.scalar_one_or_none()
 
-    async def delete_block(self, msg: Block) -> None:
+    async def delete_block(self, userid: int) -> None:
+        """
+        解除封禁用户
+        
+        Args:
+            userid (int): 用户ID
+        """
         async with self._on_session() as conn:
-            await conn.delete(msg)
+            await conn.execute(_DELETE_BLOCK, {"userid": userid})
+        self._invalidate("block", userid)
 
     async def insert_message(self, userid: int, private_msg_id: int, topic_msg_id: int, spam: bool, reason: str) -> None:
         """
@@ -294,32 +537,41 @@ class UFRepository:
             topic_msg_id (int): 话题消息ID
         """
         async with self._on_session() as conn:
-            entity = Messages(
-                userid=userid,
-                private_message_id=private_msg_id,
-                topic_message_id=topic_msg_id,
-                spam=spam,
-                reason=reason,
-                time=datetime.now(),
-            )
-            ok = await self._add_and_flush_nested_ignore_integrity(conn, entity)
-            if ok:
-                return
+            await conn.execute(_INSERT_MESSAGE_IGNORE, {
+                "userid": userid,
+                "private_message_id": private_msg_id,
+                "topic_message_id": topic_msg_id,
+                "spam": spam,
+                "reason": reason,
+                "time": datetime.now(),
+            })
 
-            stmt_by_topic = select(Messages).where(Messages.topic_message_id == topic_msg_id)
-            existing_by_topic = (await conn.execute(stmt_by_topic)).scalar_one_or_none()
-            if existing_by_topic is not None:
-                return
+    async def insert_message_many(self, rows: Sequence[tuple[int, int, int, bool, str]]) -> None:
+        """
+        批量插入消息到数据库（单个事务内 executemany）
 
-            stmt_by_private = select(Messages).where(
-                Messages.userid == userid,
-                Messages.private_message_id == private_msg_id,
-            )
-            existing_by_private = (await conn.execute(stmt_by_private)).scalar_one_or_none()
-            if existing_by_private is not None:
-                return
+        与已有记录冲突的行会被跳过，不影响同一批中的其它行
 
-            raise RuntimeError("insert_message failed but no existing row found")
+        Args:
+            rows (Sequence[tuple[int, int, int, bool, str]]): (用户ID, 私聊消息ID, 话题消息ID, 是否为垃圾消息, 理由) 组成的列表
+        """
+        if not rows:
+            return
+
+        now = datetime.now()
+        values = [
+            {
+                "userid": userid,
+                "private_message_id": private_msg_id,
+                "topic_message_id": topic_msg_id,
+                "spam": spam,
+                "reason": reason,
+                "time": now,
+            }
+            for userid, private_msg_id, topic_msg_id, spam, reason in rows
+        ]
+        async with self._on_session() as conn:
+            await conn.execute(_INSERT_MESSAGE_IGNORE, values)
 
     async def select_message(self, msg_id: int, topic_mode: bool, userid: int | None = None) -> Messages | None:
         """
@@ -336,27 +588,20 @@ class UFRepository:
         """
         async with self._on_session_readonly() as conn:
             if topic_mode:
-                stmt = select(Messages).where(
-                    Messages.topic_message_id == msg_id
-                )
+                result = await conn.execute(_SELECT_MESSAGE_BY_TOPIC, {"msg_id": msg_id})
             else:
-                stmt = select(Messages).where(
-                    Messages.userid == userid,
-                    Messages.private_message_id == msg_id
-                )
-
-            result = await conn.execute(stmt)
+                result = await conn.execute(_SELECT_MESSAGE_BY_PRIVATE, {"userid": userid, "msg_id": msg_id})
             return result.scalar_one_or_none()
 
-    async def delete_message(self, block_data: Messages) -> None:
+    async def delete_message(self, id: int) -> None:
         """
         删除数据库中的消息记录
         
         Args:
-            block_data (Messages): 要删除的消息记录对象
+            id (int): 要删除的消息记录的主键
         """
         async with self._on_session() as conn:
-            await conn.delete(block_data)
+            await conn.execute(_DELETE_MESSAGE, {"id": id})
     
     async def delete_message_on_days(self, days: int) -> None:
         """
@@ -398,12 +643,9 @@ class UFRepository:
             str | None: 如果找到设置则返回设置值，否则返回None
         """
         async with self._on_session_readonly() as conn:
-            stmt = select(RuntimeSettings).where(RuntimeSettings.setting_key == key)
+            stmt = select(RuntimeSettings.setting_value).where(RuntimeSettings.setting_key == key)
             result = await conn.execute(stmt)
-            runtime_settings = result.scalar_one_or_none()
-            if runtime_settings is None:
-                return None
-            return runtime_settings.setting_value
+            return result.scalar_one_or_none()
     
     async def delete_settings(self, key: str) -> None:
         """
@@ -416,6 +658,23 @@ class UFRepository:
             stmt = delete(RuntimeSettings).where(RuntimeSettings.setting_key == key)
             await conn.execute(stmt)
 
+    async def count_all_stats(self) -> Stats:
+        """
+        用一条 SQL 同时统计已验证用户、封禁用户、话题、消息总数与垃圾消息的数量
+        
+        Returns:
+            Stats: 各项统计数量
+        """
+        async with self._on_session_readonly() as conn:
+            stmt = select(
+                select(func.count()).select_from(Verify).where(Verify.verified.is_(True)).scalar_subquery(),
+                select(func.count()).select_from(Block).scalar_subquery(),
+                select(func.count()).select_from(Users).scalar_subquery(),
+                select(func.count()).select_from(Messages).scalar_subquery(),
+                select(func.count()).select_from(Messages).where(Messages.spam.is_(True)).scalar_subquery(),
+            )
+            return Stats(*(await conn.execute(stmt)).one())
+
     async def count_verified_users(self) -> int:
         """
         统计数据库中已验证用户的数量
@@ -23,7 +23,10 @@ from numpy.typing import NDArray
 import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import asyncio
+import multiprocessing
 from pathlib import Path
 import secrets
 
@@ -42,35 +45,41 @@ class Visual:
         self.scroll_speed: int = 2
         self.loop_frames: int = 30
         self.allowed_chars = "ABCEFHJKLMNPRTVXYZ"
+        # 字体只加载一次，不必每次生成验证码都重新解析字体文件
+        self._font: ImageFont.FreeTypeFont = ImageFont.truetype(self.font_path, self.font_size)
+        self._palette: list[int] = [0, 0, 0, 255, 255, 255]
+        # 验证码生成是纯 CPU 计算，放在独立进程中执行，不与事件循环争抢 GIL
+        self._executor: ProcessPoolExecutor | None = None
 
-    def _create_text_mask(self, text: str, font_size: int, offset: tuple[int, int]) -> NDArray[Any]:
-        mask = np.zeros((self.height, self.width), dtype=bool)
-        font = ImageFont.truetype(self.font_path, font_size)
+    def _create_text_mask(self, text: str, offset: tuple[int, int]) -> NDArray[Any]:
         img = Image.new('L', (self.width, self.height), 0)
         draw = ImageDraw.Draw(img)
-        draw.text(offset, text, font=font, fill=255)
-        text_layer = np.array(img)
-        mask[text_layer > 128] = True
-        return mask
+        draw.text(offset, text, font=self._font, fill=255)
+        text_layer = np.asarray(img)
+        return text_layer > 128
 
     def _generate_looping_noise(self, width: int, height: int, channels: int) -> NDArray[Any]:
-        noise = np.random.choice([0, 255], size=(height, width), p=[0.5, 0.5]).astype(np.uint8)
+        # 每次调用新建 Generator，避免在多个线程中共享同一个随机数状态
+        rng = np.random.default_rng()
+        noise = rng.integers(0, 2, size=(height, width), dtype=np.uint8) * np.uint8(255)
         return np.stack([noise] * channels, axis=-1)
 
-    def _generate_frame(self, frame_index: int, text_mask: NDArray[Any], noise_texture: NDArray[Any]) -> NDArray[Any]:
-        frame = np.zeros((self.height, self.width, self.channels), dtype=np.uint8)
+    def _generate_frames(self, text_mask: NDArray[Any], noise_texture: NDArray[Any]) -> NDArray[Any]:
         noise_height = noise_texture.shape[0]
-        y_coords = np.arange(self.height).reshape(-1, 1)
-        x_coords = np.arange(self.width).reshape(1, -1)
-        text_offset = (frame_index * self.scroll_speed)
-        bg_offset = -(frame_index * self.scroll_speed)
-        text_noise_y = (y_coords + text_offset) % noise_height
-        bg_noise_y = (y_coords + bg_offset) % noise_height
-        text_pixels = noise_texture[text_noise_y, x_coords]
-        bg_pixels = noise_texture[bg_noise_y, x_coords]
-        frame[text_mask] = text_pixels[text_mask]
-        frame[~text_mask] = bg_pixels[~text_mask]
-        return frame
+        # 将噪声纹理循环拼接到 noise_height + height 行，第 j 个窗口从第 j * scroll_speed 行开始，
+        # 所有窗口都是同一块内存上的步进视图，不复制数据
+        tiled = noise_texture[np.arange(noise_height + self.height) % noise_height]
+        row_stride = tiled.strides[0]
+        windows = np.lib.stride_tricks.as_strided(
+            tiled,
+            shape=(self.loop_frames + 1, self.height, self.width, self.channels),
+            strides=(self.scroll_speed * row_stride, *tiled.strides),
+            writeable=False,
+        )
+        # 文字层向下滚动，背景层向上滚动（第 loop_frames 个窗口与第 0 个相同）
+        text_stack = windows[:self.loop_frames]
+        bg_stack = windows[self.loop_frames:0:-1]
+        return np.where(text_mask[None, :, :, None], text_stack, bg_stack)
 
     def sync_generate_captcha_gif(self) -> tuple[str, BytesIO]:
         """
@@ -80,13 +89,19 @@ class Visual:
             
             tuple[str, BytesIO]: 包含验证码文本和包含验证码 GIF 图片的字节流。
         """
-        captcha_text = ''.join(secrets.choice(list(self.allowed_chars)) for _ in range(5))
-        text_mask = self._create_text_mask(captcha_text, self.font_size, (15, 22))
+        captcha_text = ''.join(secrets.choice(self.allowed_chars) for _ in range(5))
+        text_mask = self._create_text_mask(captcha_text, (15, 22))
         noise_height = self.loop_frames * self.scroll_speed
         noise_texture = self._generate_looping_noise(self.width, noise_height, self.channels)
-        frames = [Image.fromarray(self._generate_frame(i, text_mask, noise_texture)) for i in range(self.loop_frames)]
+        # 画面只有黑白两色，直接写成双色调色板图像，省去 Pillow 的量化与调色板优化
+        indices = self._generate_frames(text_mask, noise_texture)[..., 0] // 255
+        frames = []
+        for frame in indices:
+            img = Image.frombytes('P', (self.width, self.height), frame.tobytes())
+            img.putpalette(self._palette)
+            frames.append(img)
         gif_bytes = BytesIO()
-        frames[0].save(gif_bytes, format='GIF', save_all=True, append_images=frames[1:], optimize=True, duration=40, loop=0)
+        frames[0].save(gif_bytes, format='GIF', save_all=True, append_images=frames[1:], optimize=False, duration=40, loop=0)
         gif_bytes.seek(0)
         gif_bytes.name = "captcha.gif"
         return captcha_text, gif_bytes
@@ -99,4 +114,38 @@ class Visual:
             
             tuple[str, BytesIO]: 包含验证码文本和包含验证码 GIF 图片的字节流。
         """
-        return await asyncio.to_thread(self.sync_generate_captcha_gif)
+        if self._executor is None:
+            # 使用 spawn 而不是 fork，子进程不会继承主进程中的线程与锁
+            self._executor = ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+        loop = asyncio.get_running_loop()
+        try:
+            captcha_text, data = await loop.run_in_executor(self._executor, _worker_generate)
+        except BrokenProcessPool:
+            # 子进程异常退出（例如被 OOM 终止）后进程池不再可用：丢弃它，下次调用时重新创建，本次在线程中生成
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            return await asyncio.to_thread(self.sync_generate_captcha_gif)
+        gif_bytes = BytesIO(data)
+        gif_bytes.name = "captcha.gif"
+        return captcha_text, gif_bytes
+
+    def close(self) -> None:
+        """关闭生成验证码的子进程"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+_worker_visual: Visual | None = None
+
+def _init_worker() -> None:
+    global _worker_visual
+    _worker_visual = Visual()
+
+def _worker_generate() -> tuple[str, bytes]:
+    assert _worker_visual is not None
+    captcha_text, gif_bytes = _worker_visual.sync_generate_captcha_gif()
+    return captcha_text, gif_bytes.getvalue()